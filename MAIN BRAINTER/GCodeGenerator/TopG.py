@@ -1,9 +1,12 @@
 from GCodeGenerator.image_resizer import *
 from GCodeGenerator.color_quantization_kmeans import *
 from GCodeGenerator.color_quantization_PCA import *
+from GCodeGenerator.quantizer_selection import *
 from GCodeGenerator.similarityscore import *
 from GCodeGenerator.emptyfolder import *
 from GCodeGenerator.color_segmentation import *
+from GCodeGenerator.packed_masks import *
+from GCodeGenerator.speck_filter import *
 from GCodeGenerator.vectorization_findcontours import *
 
 # from GCodeGenerator.svg_parser import *
@@ -23,26 +26,222 @@ segmentation_output_folder = "MAIN BRAINTER/GCodeGenerator/Assets/Segmented Imag
 vectorization_output_folder = "MAIN BRAINTER/GCodeGenerator/Assets/Vectorized Images"
 gcode_output_folder = "MAIN BRAINTER/GCodeGenerator/Assets/GCode"
 gcode_text = "MAIN BRAINTER/GCodeGenerator/Assets/GCode/combined.txt"
+centroid_cache_path = (
+    "MAIN BRAINTER/GCodeGenerator/Assets/Centroid Cache/kmeans_centroids.json"
+)
+
+
+output_image_paths = {
+    "kmeans": output_image_path_kmeans,
+    "PCA": output_image_path_PCA,
+}
+
+
+def TopG_in_memory(
+    quantization_mode="sequential",
+    debug_artifacts=False,
+    filter_specks=True,
+    hatch_angle=0,
+    vectorization_mode="hatch",
+    vectorization_workers=1,
+    svg_format="lines",
+    speck_filter_options=None,
+):
+    """
+    Runs the whole pipeline with every stage handing its result straight to the next one.
+
+    The image is decoded once, the winning quantizer's label map goes to the segmentation,
+    the cropped layer masks, bit-packed (see packed_masks), to the hatching and the hatch
+    lines to the G-code generation and optimization. Only the combined G-code sent to the
+    plotter is written to disk, and the received image is not resized in place.
+
+    Parameters:
+    - quantization_mode: "sequential", "concurrent" or "proxy", see quantizer_selection.select_quantized_labels.
+    - debug_artifacts: Also write the quantized image, segmented masks, SVGs and optimized
+      G-code of each layer to their usual folders, after emptying them.
+    - filter_specks: Remove the regions too small to be worth drawing before the vectorization.
+    - hatch_angle: The angle of the hatch lines in degrees, or "auto" to pick the angle with
+      the fewest strokes for each layer (see vectorization_findcontours.angled_hatch_lines).
+    - vectorization_mode: "hatch", "outline", "offset" or "centerline" for every layer, or a
+      dictionary mapping color names to modes, where colors left out are hatched
+      (see vectorization_findcontours.vectorize_mask).
+    - vectorization_workers: The number of processes vectorizing the layers in parallel, largest
+      layer first, 1 to vectorize them one after the other and None for one per CPU.
+    - svg_format: The format of the debug SVGs, "lines" or "path" for a single compact <path>
+      per layer (see vectorization_findcontours.write_lines_svg).
+    - speck_filter_options: Extra arguments of speck_filter.remove_specks, such as
+      min_region_area or kernel_size, its defaults if None.
+    """
+    image = read_resized_image_rgb(input_image_path)
+    original_gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+
+    # Quantize the received image and keep the label map of the better method
+    method, labels, palette, _ = select_quantized_labels(
+        shrink_image(image),
+        original_gray,
+        preset_colors,
+        quantization_mode,
+        quantizer_options={"kmeans": {"centroid_cache_path": centroid_cache_path}},
+    )
+    print("Image Quantized")
+    print(f"{method} is more similar to the original image based on SSIM.")
+
+    if debug_artifacts:
+        empty_folder(segmentation_output_folder)
+        empty_folder(vectorization_output_folder)
+        empty_folder(gcode_output_folder)
+        cv2.imwrite(
+            output_image_paths[method],
+            cv2.cvtColor(palette[labels], cv2.COLOR_RGB2BGR),
+        )
+
+    # Segmentation of each color layer, kept bit-packed until it is vectorized
+    height, width = labels.shape
+    layer_masks = {}
+    speck_report = {}
+    for layer in segment_layers(labels, len(color_names), color_names):
+        if filter_specks:
+            layer["mask"], speck_report[layer["name"]] = remove_specks(
+                layer["mask"], **(speck_filter_options or {})
+            )
+            if not layer["mask"].any():
+                continue
+        layer_masks[layer["name"]] = PackedMask.from_layer(layer, labels.shape)
+
+    # Vectorization of each color layer
+    layer_strokes = vectorize_layers(
+        layer_masks,
+        vectorization_mode,
+        max_workers=vectorization_workers,
+        hatch_angle=hatch_angle,
+    )
+    layer_gcode = {}
+    for name, packed_mask in layer_masks.items():
+        lines, description = layer_strokes[name]
+        print(f"{name}: {description}")
+        layer_gcode[name] = lines_to_gcode(lines)
+        if debug_artifacts:
+            cv2.imwrite(
+                os.path.join(segmentation_output_folder, f"{name}.png"),
+                packed_mask.to_array(),
+            )
+            write_lines_svg(
+                os.path.join(vectorization_output_folder, f"{name}.svg"),
+                lines,
+                width,
+                height,
+                svg_format=svg_format,
+            )
+    if filter_specks:
+        print_speck_report(speck_report)
+    print("Vectorization")
+
+    # GCode Optimization of each layer
+    layer_gcode = optimize_gcode_layers(layer_gcode)
+    if debug_artifacts:
+        for name, gcode in layer_gcode.items():
+            save_optimized_gcode(
+                os.path.join(gcode_output_folder, f"{name}_gcode.txt"), gcode
+            )
 
+    # Color changing mechanism & combining gcode
+    combined_gcode = combine_gcode_layers(
+        {name: [f"{line}\n" for line in gcode] for name, gcode in layer_gcode.items()}
+    )
+    write_combined_gcode(combined_gcode, gcode_text)
+
+    start_automation(gcode_text)
 
-def TopG():
+
+def TopG(
+    quantization_mode="sequential",
+    in_memory=False,
+    debug_artifacts=False,
+    filter_specks=True,
+    hatch_angle=0,
+    vectorization_mode="hatch",
+    vectorization_workers=1,
+    svg_format="lines",
+    speck_filter_options=None,
+):
+    """
+    Runs the whole pipeline, from the received image to the G-code sent to the plotter.
+
+    Parameters:
+    - quantization_mode: "sequential" runs the kmeans and PCA quantizers one after the other and
+      compares their saved results, "concurrent" decodes the image once and runs both quantizers
+      and their SSIM scores in parallel workers, "proxy" picks the method on a downsampled proxy
+      and only runs the winner at full resolution.
+    - in_memory: Pass the data between stages in memory instead of through the asset folders
+      (see TopG_in_memory).
+    - debug_artifacts: With in_memory, still write the intermediate files for inspection.
+    - filter_specks: Remove the regions too small to be worth drawing before the vectorization
+      (see speck_filter.remove_specks).
+    - hatch_angle: The angle of the hatch lines in degrees, or "auto" to pick it for each layer.
+    - vectorization_mode: "hatch", "outline", "offset" or "centerline", for every layer or per
+      color name in a dictionary.
+    - vectorization_workers: The number of processes vectorizing the layers in parallel, 1 to
+      vectorize them one after the other and None for one per CPU.
+    - svg_format: "lines" for one <line> or <polyline> element per stroke in the SVGs, or "path"
+      for a single compact <path> per layer.
+    - speck_filter_options: Extra arguments of speck_filter.remove_specks, such as the
+      min_region_area of the regions kept, its defaults if None.
+    """
+    if in_memory:
+        TopG_in_memory(
+            quantization_mode,
+            debug_artifacts,
+            filter_specks,
+            hatch_angle,
+            vectorization_mode,
+            vectorization_workers,
+            svg_format,
+            speck_filter_options,
+        )
+        return
 
     resize_image(input_image_path, input_image_path)
 
     # Quantize the received image using kmeans and PCA
-    color_quantization_kmeans(input_image_path, output_image_path_kmeans, preset_colors)
-    print("kmeans")
-    color_quantization_PCA(input_image_path, output_image_path_PCA, preset_colors)
-    print("PCA")
-    print("Image Quantized")
+    if quantization_mode == "concurrent":
+        scores = compare_quantizers_concurrently(
+            input_image_path,
+            output_image_path_kmeans,
+            output_image_path_PCA,
+            preset_colors,
+            kmeans_options={"centroid_cache_path": centroid_cache_path},
+        )
+        ssim_kmeans, ssim_PCA = scores["kmeans"], scores["PCA"]
+        print("Image Quantized")
+    elif quantization_mode == "proxy":
+        proxy_method, _ = select_quantizer_by_proxy(
+            input_image_path,
+            output_image_paths,
+            preset_colors,
+            quantizer_options={"kmeans": {"centroid_cache_path": centroid_cache_path}},
+        )
+        print("Image Quantized")
+    elif quantization_mode == "sequential":
+        color_quantization_kmeans(
+            input_image_path,
+            output_image_path_kmeans,
+            preset_colors,
+            centroid_cache_path=centroid_cache_path,
+        )
+        print("kmeans")
+        color_quantization_PCA(input_image_path, output_image_path_PCA, preset_colors)
+        print("PCA")
+        print("Image Quantized")
 
-    # Compare kmeans and PCA
-    # read generated images with opencv
-    original = cv2.imread(input_image_path, 0)
-    Kmeans_image = cv2.imread(output_image_path_kmeans, 0)
-    PCA_image = cv2.imread(output_image_path_PCA, 0)
-    ssim_PCA = structural_sim(original, PCA_image)
-    ssim_kmeans = structural_sim(original, Kmeans_image)
+        # Compare kmeans and PCA
+        # read generated images with opencv
+        original = cv2.imread(input_image_path, 0)
+        Kmeans_image = cv2.imread(output_image_path_kmeans, 0)
+        PCA_image = cv2.imread(output_image_path_PCA, 0)
+        ssim_PCA = structural_sim(original, PCA_image)
+        ssim_kmeans = structural_sim(original, Kmeans_image)
+    else:
+        raise ValueError(f"Unknown quantization_mode '{quantization_mode}'.")
 
     # empty folders
     empty_folder(segmentation_output_folder)
@@ -50,25 +249,35 @@ def TopG():
     empty_folder(gcode_output_folder)
 
     # segmentation based on better method
-    if ssim_PCA > ssim_kmeans:
+    if quantization_mode == "proxy":
+        print(f"{proxy_method} is more similar to the proxy image based on SSIM.")
+        quantized_image_path = output_image_paths[proxy_method]
+    elif ssim_PCA > ssim_kmeans:
         print("PCA is more similar to the original image based on SSIM.")
-        color_segmentation(
-            output_image_path_PCA,
-            segmentation_output_folder,
-            preset_colors,
-            color_names,
-        )
+        quantized_image_path = output_image_path_PCA
     else:
         print("KMeans is more similar to the original image based on SSIM.")
-        color_segmentation(
-            output_image_path_kmeans,
-            segmentation_output_folder,
-            preset_colors,
-            color_names,
-        )
+        quantized_image_path = output_image_path_kmeans
+    color_segmentation(
+        quantized_image_path,
+        segmentation_output_folder,
+        preset_colors,
+        color_names,
+    )
+
+    # remove the specks that would each cost a pen lift
+    if filter_specks:
+        speck_filtering(segmentation_output_folder, **(speck_filter_options or {}))
 
     # vectorization step
-    vectorization(segmentation_output_folder, vectorization_output_folder)
+    vectorization(
+        segmentation_output_folder,
+        vectorization_output_folder,
+        hatch_angle=hatch_angle,
+        vectorization_mode=vectorization_mode,
+        max_workers=vectorization_workers,
+        svg_format=svg_format,
+    )
     print("Vectorization")
 
     # SVG Manipulation Step
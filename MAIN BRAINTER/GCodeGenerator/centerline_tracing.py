@@ -0,0 +1,136 @@
+import cv2
+import numpy as np
+from skimage.morphology import skeletonize
+
+# Neighbours of a skeleton pixel, straight ones first
+neighbour_offsets = (
+    (-1, 0),
+    (0, -1),
+    (0, 1),
+    (1, 0),
+    (-1, -1),
+    (-1, 1),
+    (1, -1),
+    (1, 1),
+)
+
+
+def split_thin_components(mask, thin_width=3):
+    """
+    Splits a mask into its thin and wide connected regions.
+
+    The width of a region is the width of its widest part: the largest distance from a pixel
+    to the edge of the region, measured on the mask at twice its resolution. Doubling puts a
+    pixel on the middle of every line, whether its width is odd or even, so a straight line
+    w pixels wide measures w at any angle, up to the pixel staircase of diagonal lines. A
+    region is thin when its width rounded to the nearest pixel is at most thin_width.
+
+    Parameters:
+    - mask: A 2D mask where non-zero pixels belong to the layer.
+    - thin_width: The widest line, in pixels, that is still considered thin.
+
+    Returns:
+    - A tuple (thin_mask, wide_mask) of uint8 masks (255 inside, 0 outside).
+    """
+    binary = np.where(mask > 0, 255, 0).astype(np.uint8)
+    num_regions, region_labels = cv2.connectedComponents(binary, connectivity=8)
+    # Distance of every doubled pixel to the nearest empty one, outside the mask counting as
+    # empty. It is in doubled pixels, twice the distance to the edge in original pixels.
+    doubled = cv2.resize(binary, None, fx=2, fy=2, interpolation=cv2.INTER_NEAREST)
+    padded = cv2.copyMakeBorder(doubled, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+    distances = cv2.distanceTransform(padded, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+    height, width = binary.shape
+    distances = distances[1:-1, 1:-1].reshape((height, 2, width, 2)).max(axis=(1, 3))
+    region_widths = np.zeros(num_regions, dtype=np.float32)
+    np.maximum.at(region_widths, region_labels, distances)
+    thin = region_widths <= thin_width + 0.5
+    thin[0] = False  # background
+    thin_mask = np.where(thin[region_labels], 255, 0).astype(np.uint8)
+    return thin_mask, cv2.subtract(binary, thin_mask)
+
+
+def trace_skeleton(skeleton):
+    """
+    Follows the pixels of a one pixel wide skeleton and returns them as polylines.
+
+    Each polyline runs between two ends or junctions of the skeleton, and closed loops give one
+    polyline each. A diagonal step is only taken when no straight step links the same pixels,
+    so the corners of the skeleton do not give tiny extra polylines.
+
+    Parameters:
+    - skeleton: A 2D boolean skeleton, such as the output of skimage.morphology.skeletonize.
+
+    Returns:
+    - A list of polylines, each a list of (x, y) points.
+    """
+    padded = np.pad(np.asarray(skeleton, dtype=bool), 1)
+
+    def neighbours(pixel):
+        y, x = pixel
+        found = []
+        for dy, dx in neighbour_offsets:
+            if not padded[y + dy, x + dx]:
+                continue
+            if dy and dx and (padded[y + dy, x] or padded[y, x + dx]):
+                continue  # reachable through a straight neighbour
+            found.append((y + dy, x + dx))
+        return found
+
+    pixels = list(zip(*np.nonzero(padded)))
+    degrees = {pixel: len(neighbours(pixel)) for pixel in pixels}
+    visited_edges = set()
+
+    def walk(start, step):
+        path = [start, step]
+        visited_edges.add(frozenset((start, step)))
+        previous, current = start, step
+        while degrees[current] == 2 and current != start:
+            following = [
+                pixel
+                for pixel in neighbours(current)
+                if pixel != previous
+                and frozenset((current, pixel)) not in visited_edges
+            ]
+            if not following:
+                break
+            previous, current = current, following[0]
+            visited_edges.add(frozenset((previous, current)))
+            path.append(current)
+        return path
+
+    paths = []
+    # Ends and junctions first, then whatever is left belongs to closed loops
+    for pixel in sorted(pixels, key=lambda pixel: degrees[pixel] == 2):
+        if degrees[pixel] == 0:
+            paths.append([pixel, pixel])
+        for step in neighbours(pixel):
+            if frozenset((pixel, step)) not in visited_edges:
+                paths.append(walk(pixel, step))
+    return [[(x - 1, y - 1) for y, x in path] for path in paths]
+
+
+def centerline_strokes(mask, outline_tolerance=1.0, origin=(0, 0)):
+    """
+    Traces the centerlines of the shapes of a mask as open polylines.
+
+    Parameters:
+    - mask: A 2D mask where non-zero pixels belong to the layer.
+    - outline_tolerance: The polyline simplification tolerance.
+    - origin: The (x, y) position of mask inside the full image.
+
+    Returns:
+    - A list of strokes in full image coordinates, each a list of (x, y) points.
+    """
+    strokes = []
+    for path in trace_skeleton(skeletonize(mask > 0)):
+        closed = len(path) > 2 and path[0] == path[-1]
+        polyline = cv2.approxPolyDP(
+            np.array(path[:-1] if closed else path, dtype=np.int32),
+            outline_tolerance,
+            closed,
+        ).reshape((-1, 2))
+        points = [(int(x) + origin[0], int(y) + origin[1]) for x, y in polyline]
+        if closed or len(points) == 1:
+            points.append(points[0])
+        strokes.append(points)
+    return strokes
@@ -0,0 +1,123 @@
+import json
+import os
+import numpy as np
+
+
+def color_histogram(image, bins_per_channel=4):
+    """
+    Computes a coarse, normalized RGB histogram used to recognize similar images.
+
+    Parameters:
+    - image: The input image as a uint8 numpy array with shape (..., 3).
+    - bins_per_channel: The number of bins along each color channel.
+
+    Returns:
+    - A flat array of bins_per_channel ** 3 values summing to 1.
+    """
+    pixels = image.reshape((-1, 3)).astype(np.intp) * bins_per_channel // 256
+    bins = (
+        pixels[:, 0] * bins_per_channel + pixels[:, 1]
+    ) * bins_per_channel + pixels[:, 2]
+    histogram = np.bincount(bins, minlength=bins_per_channel**3).astype(float)
+    return histogram / max(histogram.sum(), 1)
+
+
+def load_centroid_cache(cache_path):
+    """
+    Reads the cached centroids from a JSON file.
+
+    Parameters:
+    - cache_path: Path to the cache file.
+
+    Returns:
+    - A list of entries with "histogram" and "centroids" keys, empty if the file is missing or unreadable.
+    """
+    if not os.path.exists(cache_path):
+        return []
+    try:
+        with open(cache_path, "r") as file:
+            return json.load(file)
+    except (OSError, ValueError) as e:
+        print(f"Failed to read centroid cache {cache_path}. Reason: {e}")
+        return []
+
+
+def closest_cache_entry(cache, histogram, num_clusters):
+    """
+    Finds the cache entry with the same number of centroids whose histogram is closest to the given one.
+
+    Parameters:
+    - cache: The list of cache entries returned by load_centroid_cache.
+    - histogram: The histogram of the image, from color_histogram.
+    - num_clusters: The number of centroids required.
+
+    Returns:
+    - A tuple (index, distance) with the L1 distance between the histograms, or (None, None) if no
+      entry has num_clusters centroids.
+    """
+    best_index, best_distance = None, None
+    for index, entry in enumerate(cache):
+        if len(entry["centroids"]) != num_clusters:
+            continue
+        if len(entry["histogram"]) != len(histogram):
+            continue
+        distance = float(np.abs(np.asarray(entry["histogram"]) - histogram).sum())
+        if best_distance is None or distance < best_distance:
+            best_index, best_distance = index, distance
+    return best_index, best_distance
+
+
+def find_cached_centroids(cache, histogram, num_clusters, max_distance=0.1):
+    """
+    Finds the cached centroids of the image whose histogram is closest to the given one.
+
+    Parameters:
+    - cache: The list of cache entries returned by load_centroid_cache.
+    - histogram: The histogram of the current image, from color_histogram.
+    - num_clusters: The number of centroids required.
+    - max_distance: The largest L1 distance between histograms still counted as a match.
+
+    Returns:
+    - A tuple (centroids, distance), or (None, None) if no entry is close enough.
+    """
+    index, distance = closest_cache_entry(cache, histogram, num_clusters)
+    if index is None or distance > max_distance:
+        return None, None
+    return np.asarray(cache[index]["centroids"], dtype=float), distance
+
+
+def store_centroids(
+    cache_path, cache, histogram, centroids, max_entries=64, max_distance=0.1
+):
+    """
+    Adds the centroids of an image to the cache and writes it to disk.
+
+    An entry matching the image, as find_cached_centroids would return it, is replaced instead
+    of kept next to the new one, so refitting the same or a similar image does not grow the
+    cache. The oldest entries are dropped once the cache holds more than max_entries images.
+
+    Parameters:
+    - cache_path: Path to the cache file.
+    - cache: The list of cache entries returned by load_centroid_cache.
+    - histogram: The histogram of the image, from color_histogram.
+    - centroids: The fitted centroids as RGB values.
+    - max_entries: The maximum number of images kept in the cache.
+    - max_distance: The largest L1 distance between histograms still counted as a match.
+    """
+    index, distance = closest_cache_entry(cache, histogram, len(centroids))
+    if index is not None and distance <= max_distance:
+        # The replacement goes to the end, as the most recent entry
+        del cache[index]
+    cache.append(
+        {
+            "histogram": np.asarray(histogram).tolist(),
+            "centroids": np.asarray(centroids, dtype=float).tolist(),
+        }
+    )
+    del cache[:-max_entries]
+
+    cache_folder = os.path.dirname(cache_path)
+    if cache_folder:
+        os.makedirs(cache_folder, exist_ok=True)
+    with open(cache_path, "w") as file:
+        json.dump(cache, file)
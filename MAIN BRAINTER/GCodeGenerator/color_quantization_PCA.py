@@ -1,100 +1,129 @@
 import cv2
 import numpy as np
 import time
-from sklearn.decomposition import PCA
+from sklearn.decomposition import PCA, IncrementalPCA
+from GCodeGenerator.palette import Palette, preset_colors
+from GCodeGenerator.image_resizer import load_image_rgb
 
 
-def color_quantization_PCA(
-    input_image_path,
-    output_image_path,
+def quantize_labels_PCA(
+    image,
     preset_colors,
     num_components=3,
-    max_image_size=1024,
+    pca_mode="full",
+    tile_rows=64,
 ):
     """
-    Function to apply color quantization to an image using PCA.
+    Function to quantize an RGB image in memory using PCA and return a label map.
+    The input image is only read, never modified.
 
-    :param input_image_path: Path to the input image.
-    :param output_image_path: Path where the quantized image will be saved.
+    :param image: The input image as an RGB numpy array.
     :param preset_colors: Array of RGB values of the preset colors.
     :param num_components: Number of principal components to keep.
-    :param max_image_size: Maximum size to which the image is resized.
+    :param pca_mode: "full" fits PCA on the whole pixel matrix at once, "tiled" fits IncrementalPCA
+        on float32 tiles and reconstructs tile by tile into a preallocated uint8 image, so peak
+        memory stays close to the size of the uint8 image.
+    :param tile_rows: Number of image rows per tile in "tiled" mode.
+    :return: A tuple (labels, palette): a uint8 label map holding the index of each pixel's
+        preset color, and the preset colors as a uint8 array.
     """
-
-    def find_closest_color(pixel, colors):
-        distances = np.sqrt(np.sum((colors - pixel) ** 2, axis=1))
-        return colors[np.argmin(distances)]
+    if pca_mode not in ("full", "tiled"):
+        raise ValueError(f"Unknown pca_mode '{pca_mode}'.")
 
     def pca_reduce_colors(image, num_components):
         pixels = image.reshape((-1, 3))
         pca = PCA(n_components=num_components)
         reduced_colors = pca.fit_transform(pixels)
         reconstructed_pixels = pca.inverse_transform(reduced_colors)
-        # Ensure the reconstructed pixels are clipped to valid range and converted to uint8
-        reconstructed_pixels = np.clip(reconstructed_pixels, 0, 255).astype(np.uint8)
+        # Ensure the reconstructed pixels are clipped to valid range and rounded to uint8
+        reconstructed_pixels = np.rint(np.clip(reconstructed_pixels, 0, 255)).astype(
+            np.uint8
+        )
         return reconstructed_pixels.reshape(image.shape)
 
-    def map_colors_to_preset(image, preset_colors):
-        mapped_image = np.zeros_like(image)
-        for i in range(image.shape[0]):
-            for j in range(image.shape[1]):
-                original_color = image[i, j]
-                new_color = find_closest_color(original_color, preset_colors)
-                mapped_image[i, j] = new_color
-        return mapped_image
-
-    # Read the image
-    image = cv2.imread(input_image_path)
-    if image is None:
-        raise ValueError("Could not read the image.")
-
-    # Resize if necessary
-    height, width = image.shape[:2]
-    if max(height, width) > max_image_size:
-        scaling_factor = max_image_size / max(height, width)
-        image = cv2.resize(
-            image,
-            None,
-            fx=scaling_factor,
-            fy=scaling_factor,
-            interpolation=cv2.INTER_AREA,
-        )
+    def pca_reduce_colors_tiled(image, num_components, tile_rows):
+        pixels = image.reshape((-1, 3))
+        tile_size = max(tile_rows * image.shape[1], num_components)
+        tiles = range(0, pixels.shape[0], tile_size)
+
+        # First pass: fit the components one tile at a time
+        pca = IncrementalPCA(n_components=num_components)
+        for start in tiles:
+            tile = pixels[start : start + tile_size].astype(np.float32)
+            # partial_fit needs at least as many samples as components
+            if tile.shape[0] >= num_components:
+                pca.partial_fit(tile)
+
+        # Second pass: reconstruct each tile straight into the output image
+        reconstructed_pixels = np.empty_like(pixels)
+        for start in tiles:
+            # Reconstruct in float64 and round, as in the full mode, so a value such as
+            # 199.99998 does not truncate to 199
+            tile = pixels[start : start + tile_size].astype(np.float64)
+            reconstructed_tile = pca.inverse_transform(pca.transform(tile))
+            np.clip(reconstructed_tile, 0, 255, out=reconstructed_tile)
+            np.rint(reconstructed_tile, out=reconstructed_tile)
+            reconstructed_pixels[start : start + tile_size] = reconstructed_tile.astype(
+                np.uint8
+            )
+        return reconstructed_pixels.reshape(image.shape)
 
-    # Convert BGR to RGB
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    def map_colors_to_preset(image, preset_colors):
+        return Palette(preset_colors).indices(image)
 
     # PCA color reduction
-    reduced_image = pca_reduce_colors(image, num_components)
+    if pca_mode == "tiled":
+        reduced_image = pca_reduce_colors_tiled(image, num_components, tile_rows)
+    else:
+        reduced_image = pca_reduce_colors(image, num_components)
 
     # Map reduced colors to preset colors
-    quantized_image = map_colors_to_preset(reduced_image, preset_colors)
+    labels = map_colors_to_preset(reduced_image, preset_colors)
+    return labels, np.asarray(preset_colors).astype(np.uint8)
+
+
+def quantize_image_PCA(image, preset_colors, *args, **kwargs):
+    """
+    Function to apply color quantization to an RGB image in memory using PCA.
+    Takes the same parameters as quantize_labels_PCA.
+
+    :return: The quantized image as an RGB numpy array.
+    """
+    labels, palette = quantize_labels_PCA(image, preset_colors, *args, **kwargs)
+    return palette[labels]
+
+
+def color_quantization_PCA(
+    input_image_path,
+    output_image_path,
+    preset_colors,
+    num_components=3,
+    max_image_size=1024,
+    **kwargs,
+):
+    """
+    Function to apply color quantization to an image using PCA.
+
+    :param input_image_path: Path to the input image.
+    :param output_image_path: Path where the quantized image will be saved.
+    :param preset_colors: Array of RGB values of the preset colors.
+    :param num_components: Number of principal components to keep.
+    :param max_image_size: Maximum size to which the image is resized.
+    :param kwargs: Options passed to quantize_image_PCA (pca_mode, tile_rows).
+    :return: The quantized image in BGR order, as saved to output_image_path.
+    """
+    image = load_image_rgb(input_image_path, max_image_size)
+
+    quantized_image = quantize_image_PCA(image, preset_colors, num_components, **kwargs)
 
     # Convert back to BGR for saving
     quantized_image = cv2.cvtColor(quantized_image, cv2.COLOR_RGB2BGR)
 
     # Save the image
     cv2.imwrite(output_image_path, quantized_image)
+    return quantized_image
 
 
-# Preset List of colors
-preset_colors = np.array(
-    [
-        [0, 0, 0],  # Black
-        [135, 135, 135],  # Grey
-        [180, 20, 20],  # Red
-        [50, 160, 50],  # Green
-        [50, 50, 180],  # Blue
-        [60, 224, 224],  # Cyan
-        [125, 47, 228],  # Purple
-        [218, 218, 40],  # Yellow
-        [255, 137, 38],  # Orange
-        [243, 243, 243],  # Light Grey
-        [24, 69, 77],  # Teal
-        [0, 127, 255],  # Azure
-        [170, 90, 150],  # Pink
-    ]
-)
-
 # # Example usage
 # if __name__ == "__main__":
 #     input_image_path = "GCodeGenerator/Assets/Images/img_5.png"
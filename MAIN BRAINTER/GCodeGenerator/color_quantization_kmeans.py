@@ -1,42 +1,102 @@
 import cv2
 import numpy as np
+import os
+import tempfile
 import time
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from GCodeGenerator.palette_mapping import label_image_through_centroids
+from GCodeGenerator.palette import preset_colors
+from GCodeGenerator.image_resizer import load_image_rgb
+from GCodeGenerator.similarityscore import structural_sim
+from GCodeGenerator.centroid_cache import (
+    color_histogram,
+    load_centroid_cache,
+    find_cached_centroids,
+    store_centroids,
+)
 
+kmeans_fit_modes = ("full", "sample", "minibatch", "unique")
 
-def color_quantization_kmeans(
-    input_image_path,
-    output_image_path,
+
+def stratified_pixel_sample(pixels, sample_size, random_state=None):
+    """
+    Draws a stratified random sample of pixels.
+
+    The pixel array is split into sample_size consecutive strata of (almost) equal length
+    and one pixel is drawn at random from each, so every region of the image is represented.
+
+    Parameters:
+    - pixels: Array of RGB values with shape (num_pixels, 3).
+    - sample_size: The number of pixels to draw.
+    - random_state: Seed or numpy Generator used to draw the sample.
+
+    Returns:
+    - An array of at most sample_size RGB values.
+    """
+    if sample_size is None or sample_size >= len(pixels):
+        return pixels
+    rng = np.random.default_rng(random_state)
+    bounds = np.linspace(0, len(pixels), sample_size + 1).astype(np.intp)
+    offsets = (rng.random(sample_size) * np.diff(bounds)).astype(np.intp)
+    return pixels[bounds[:-1] + offsets]
+
+
+def unique_colors_with_counts(pixels):
+    """
+    Collapses an array of pixels to its distinct colors and how often each one occurs.
+
+    Parameters:
+    - pixels: Array of uint8 RGB values with shape (num_pixels, 3).
+
+    Returns:
+    - A tuple (colors, counts) with the distinct RGB values and their pixel counts.
+    """
+    pixels = pixels.astype(np.uint32)
+    # Pack each color into one integer so np.unique works on a flat array
+    keys = (pixels[:, 0] << 16) | (pixels[:, 1] << 8) | pixels[:, 2]
+    keys, counts = np.unique(keys, return_counts=True)
+    colors = np.stack([keys >> 16, (keys >> 8) & 255, keys & 255], axis=1)
+    return colors.astype(np.uint8), counts
+
+
+def quantize_labels_kmeans(
+    image,
     preset_colors,
     num_clusters=18,
-    max_image_size=1024,
+    fit_mode="full",
+    sample_size=20000,
+    batch_size=4096,
+    random_state=None,
+    centroid_cache_path=None,
+    cache_max_distance=0.1,
 ):
     """
-    This function applies color quantization to an image using K-means clustering.
+    Quantizes an RGB image in memory using K-means clustering and returns a label map.
     It first reduces the number of colors to a specified number of clusters and then maps
-    these colors to a set of preset colors. The quantized image is then saved to a file.
+    these colors to a set of preset colors. The input image is only read, never modified.
 
     Parameters:
-    - input_image_path: Path to the input image file.
-    - output_image_path: Path where the quantized image will be saved.
+    - image: The input image as an RGB numpy array.
     - preset_colors: Array of RGB values representing the preset colors to map the image colors to.
     - num_clusters: The number of clusters to use for K-means clustering.
-    - max_image_size: The maximum size (width or height) to which the image will be resized, to speed up processing.
-    """
-
-    def find_closest_color(pixel, colors):
-        """
-        Finds the closest color to a given pixel from a list of colors.
+    - fit_mode: "full" fits KMeans on every pixel, "sample" fits KMeans on a stratified pixel sample
+      and "minibatch" fits MiniBatchKMeans on that sample. The whole image is labeled with the
+      resulting centroids in every mode. "unique" fits KMeans on the distinct colors of the image
+      weighted by their pixel counts, which gives the same objective as the full fit.
+    - sample_size: The number of pixels drawn for the "sample" and "minibatch" modes.
+    - batch_size: The mini-batch size used by the "minibatch" mode.
+    - random_state: Seed used for sampling and centroid initialization.
+    - centroid_cache_path: Path to a JSON file of centroids from previous images. When given, an
+      image whose coarse color histogram is close to a cached one starts K-means from the cached
+      centroids with a single initialization, and its own centroids are added to the cache.
+    - cache_max_distance: The largest L1 distance between histograms counted as a cache hit.
 
-        Parameters:
-        - pixel: The RGB values of the pixel.
-        - colors: An array of RGB colors to find the closest color from.
-
-        Returns:
-        - The RGB values of the closest color found.
-        """
-        distances = np.sqrt(np.sum((colors - pixel) ** 2, axis=1))
-        return colors[np.argmin(distances)]
+    Returns:
+    - A tuple (labels, palette): a uint8 label map holding the index of each pixel's preset
+      color, and the preset colors as a uint8 array.
+    """
+    if fit_mode not in kmeans_fit_modes:
+        raise ValueError(f"Unknown fit_mode '{fit_mode}'.")
 
     def k_means_cluster_colors(image, num_clusters):
         """
@@ -50,96 +110,169 @@ def color_quantization_kmeans(
         - An array of RGB values representing the centroids of the clusters.
         """
         pixels = image.reshape((-1, 3))
-        kmeans = KMeans(n_clusters=num_clusters)
-        kmeans.fit(pixels)
-        return kmeans.cluster_centers_.astype(int)
+        sample_weight = None
+        if fit_mode == "unique":
+            pixels, sample_weight = unique_colors_with_counts(pixels)
+        elif fit_mode != "full":
+            pixels = stratified_pixel_sample(pixels, sample_size, random_state)
+        # Fewer distinct colors than clusters leaves every color as its own centroid
+        num_clusters = min(num_clusters, len(pixels))
 
-    def map_clusters_to_preset(centroids, preset_colors):
-        """
-        Maps the cluster centroids to the closest preset color.
+        # Seed the fit with the centroids of a previous image with a similar histogram
+        init_options = {}
+        if centroid_cache_path is not None:
+            cache = load_centroid_cache(centroid_cache_path)
+            histogram = color_histogram(image)
+            cached_centroids, distance = find_cached_centroids(
+                cache, histogram, num_clusters, cache_max_distance
+            )
+            if cached_centroids is not None:
+                print(f"Centroid cache hit (histogram distance {distance:.3f})")
+                init_options = {"init": cached_centroids, "n_init": 1}
+            else:
+                print("Centroid cache miss")
 
-        Parameters:
-        - centroids: The centroids of the clusters as RGB values.
-        - preset_colors: The preset colors to map the centroids to.
+        if fit_mode == "minibatch":
+            kmeans = MiniBatchKMeans(
+                n_clusters=num_clusters,
+                batch_size=batch_size,
+                random_state=random_state,
+                **init_options,
+            )
+        else:
+            kmeans = KMeans(
+                n_clusters=num_clusters, random_state=random_state, **init_options
+            )
+        kmeans.fit(pixels, sample_weight=sample_weight)
 
-        Returns:
-        - An array of RGB values where each centroid is replaced by the closest preset color.
-        """
-        return np.array(
-            [find_closest_color(centroid, preset_colors) for centroid in centroids]
-        )
+        if centroid_cache_path is not None:
+            print(f"K-means converged in {kmeans.n_iter_} iterations")
+            store_centroids(
+                centroid_cache_path,
+                cache,
+                histogram,
+                kmeans.cluster_centers_,
+                max_distance=cache_max_distance,
+            )
+        return kmeans.cluster_centers_.astype(int)
 
-    def replace_colors(image, centroids, mapped_colors):
+    def label_pixels(image, centroids, preset_colors):
         """
-        Replaces the colors in the original image with the mapped preset colors.
+        Labels the pixels of the original image with the preset colors mapped from the centroids.
 
         Parameters:
         - image: The original image.
         - centroids: The centroids of the clusters.
-        - mapped_colors: The preset colors mapped from the centroids.
+        - preset_colors: The preset colors the labels index into.
 
         Returns:
-        - The image with colors replaced by the closest mapped preset colors.
+        - A uint8 label map holding, for each pixel, the index of its preset color.
         """
-        new_image = np.zeros_like(image)
-        for i in range(image.shape[0]):
-            for j in range(image.shape[1]):
-                original_color = image[i, j]
-                closest_centroid = find_closest_color(original_color, centroids)
-                new_color = find_closest_color(closest_centroid, mapped_colors)
-                new_image[i, j] = new_color
-        return new_image
-
-    # Read the image
-    image = cv2.imread(input_image_path)
-    if image is None:
-        raise ValueError("Could not read the image.")
-
-    # Resize if necessary
-    height, width = image.shape[:2]
-    if max(height, width) > max_image_size:
-        scaling_factor = max_image_size / max(height, width)
-        image = cv2.resize(
-            image,
-            None,
-            fx=scaling_factor,
-            fy=scaling_factor,
-            interpolation=cv2.INTER_AREA,
-        )
-
-    # Convert BGR to RGB
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        return label_image_through_centroids(image, centroids, preset_colors)
 
     # Quantization process
     centroids = k_means_cluster_colors(image, num_clusters)
-    mapped_colors = map_clusters_to_preset(centroids, preset_colors)
-    reduced_image = replace_colors(image, centroids, mapped_colors)
+    labels = label_pixels(image, centroids, preset_colors)
+    return labels, np.asarray(preset_colors).astype(np.uint8)
+
+
+def quantize_image_kmeans(image, preset_colors, *args, **kwargs):
+    """
+    Applies color quantization to an RGB image in memory using K-means clustering.
+
+    Takes the same parameters as quantize_labels_kmeans.
+
+    Returns:
+    - The quantized image as an RGB numpy array.
+    """
+    labels, palette = quantize_labels_kmeans(image, preset_colors, *args, **kwargs)
+    return palette[labels]
+
+
+def color_quantization_kmeans(
+    input_image_path,
+    output_image_path,
+    preset_colors,
+    num_clusters=18,
+    max_image_size=1024,
+    **kwargs,
+):
+    """
+    This function applies color quantization to an image using K-means clustering.
+    It first reduces the number of colors to a specified number of clusters and then maps
+    these colors to a set of preset colors. The quantized image is then saved to a file.
+
+    Parameters:
+    - input_image_path: Path to the input image file.
+    - output_image_path: Path where the quantized image will be saved.
+    - preset_colors: Array of RGB values representing the preset colors to map the image colors to.
+    - num_clusters: The number of clusters to use for K-means clustering.
+    - max_image_size: The maximum size (width or height) to which the image will be resized, to speed up processing.
+    - kwargs: Fitting options passed to quantize_image_kmeans (fit_mode, sample_size, batch_size,
+      random_state, centroid_cache_path, cache_max_distance).
+
+    Returns:
+    - The quantized image in BGR order, as saved to output_image_path.
+    """
+    image = load_image_rgb(input_image_path, max_image_size)
+
+    reduced_image = quantize_image_kmeans(image, preset_colors, num_clusters, **kwargs)
 
     # Convert back to BGR for saving
     reduced_image = cv2.cvtColor(reduced_image, cv2.COLOR_RGB2BGR)
 
     # Save the image
     cv2.imwrite(output_image_path, reduced_image)
+    return reduced_image
 
 
-# Preset List of colors
-preset_colors = np.array(
-    [
-        [0, 0, 0],  # Black
-        [135, 135, 135],  # Grey
-        [180, 20, 20],  # Red
-        [50, 160, 50],  # Green
-        [50, 50, 180],  # Blue
-        [60, 224, 224],  # Cyan
-        [125, 47, 228],  # Purple
-        [218, 218, 40],  # Yellow
-        [255, 137, 38],  # Orange
-        [243, 243, 243],  # Light Grey
-        [24, 69, 77],  # Teal
-        [0, 127, 255],  # Azure
-        [170, 90, 150],  # Pink
-    ]
-)
+def kmeans_fit_mode_report(
+    input_image_path, preset_colors, fit_modes=kmeans_fit_modes, **kwargs
+):
+    """
+    Quantizes an image with each K-means fit mode and reports time and SSIM against the full fit.
+
+    Parameters:
+    - input_image_path: Path to the input image file.
+    - preset_colors: Array of RGB values representing the preset colors.
+    - fit_modes: The fit modes to compare. "full" is always included as the reference.
+    - kwargs: Extra arguments passed to color_quantization_kmeans (sample_size, batch_size, ...).
+
+    Returns:
+    - A dictionary mapping each fit mode to its time, SSIM and SSIM change against the full fit.
+    """
+    original = cv2.imread(input_image_path, 0)
+    if original is None:
+        raise ValueError("Could not read the image.")
+
+    fit_modes = ["full"] + [mode for mode in fit_modes if mode != "full"]
+    report = {}
+    with tempfile.TemporaryDirectory() as temporary_folder:
+        for fit_mode in fit_modes:
+            output_image_path = os.path.join(temporary_folder, f"{fit_mode}.png")
+            start_time = time.time()
+            color_quantization_kmeans(
+                input_image_path,
+                output_image_path,
+                preset_colors,
+                fit_mode=fit_mode,
+                **kwargs,
+            )
+            duration = time.time() - start_time
+            quantized = cv2.imread(output_image_path, 0)
+            report[fit_mode] = {
+                "time": duration,
+                "ssim": structural_sim(original, quantized),
+            }
+
+    for fit_mode, result in report.items():
+        result["ssim_change"] = result["ssim"] - report["full"]["ssim"]
+        print(
+            f"{fit_mode}: {result['time']:.2f} seconds, SSIM {result['ssim']:.4f} "
+            f"({result['ssim_change']:+.4f} against full fit)"
+        )
+    return report
+
 
 # # Example usage
 # if __name__ == "__main__":
@@ -155,3 +288,8 @@ preset_colors = np.array(
 #         )
 #     except Exception as e:
 #         print("Error:", e)
+
+# # Fit mode comparison
+# if __name__ == "__main__":
+#     input_image_path = "MAIN BRAINTER/GCodeGenerator/Assets/Images/brainter.png"
+#     kmeans_fit_mode_report(input_image_path, preset_colors, sample_size=20000)
@@ -2,9 +2,124 @@ import cv2
 import numpy as np
 import os
 import time
+from GCodeGenerator.palette import Palette, preset_colors, color_names
+from GCodeGenerator.packed_masks import pack_layers, save_packed_masks
 
 
-def color_segmentation(input_image_path, output_folder, preset_colors, color_names):
+def image_to_label_map(image, preset_colors):
+    """
+    Converts a quantized RGB image back into a label map.
+
+    Parameters:
+    - image: The quantized image as an RGB numpy array.
+    - preset_colors: Preset array of colors.
+
+    Returns:
+    - A uint8 label map holding the index of each pixel's preset color, or 255 for pixels
+      that do not exactly match any preset color.
+    """
+    palette = Palette(preset_colors)
+    labels = palette.indices(image)
+    exact = np.all(palette.colors[labels] == image, axis=-1)
+    return np.where(exact, labels, 255).astype(np.uint8)
+
+
+def segment_layers(labels, num_colors, color_names=None):
+    """
+    Splits a label map into cropped color layers with per-layer statistics, in a single pass.
+
+    The pixels are grouped by label with one stable sort, and each group gives its layer's
+    pixel area, bounding box and mask at once. Each mask is cropped to its bounding box.
+
+    Parameters:
+    - labels: A uint8 label map of indices into the preset colors.
+    - num_colors: The number of preset colors. Labels outside this range are ignored.
+    - color_names: Optional list of names corresponding to each color in the preset.
+
+    Returns:
+    - A list of layers sorted by decreasing area. Each layer is a dictionary with the keys
+      "index", "name", "area", "bbox" as (x, y, width, height) like cv2.boundingRect,
+      and "mask", the mask cropped to the bounding box (255 inside, 0 outside).
+    """
+    width = labels.shape[1]
+    flat_labels = labels.ravel()
+    counts = np.bincount(flat_labels, minlength=num_colors)
+    pixel_order = np.argsort(flat_labels, kind="stable")
+    groups = np.split(pixel_order, np.cumsum(counts)[:-1])
+
+    layers = []
+    for index in range(num_colors):
+        if counts[index] == 0:
+            continue
+        # The stable sort keeps each group in raster order, so the rows are already sorted
+        rows, columns = np.divmod(groups[index], width)
+        x, y = int(columns.min()), int(rows[0])
+        bbox = (x, y, int(columns.max()) - x + 1, int(rows[-1]) - y + 1)
+        mask = np.zeros((bbox[3], bbox[2]), dtype=np.uint8)
+        mask[rows - y, columns - x] = 255
+        layers.append(
+            {
+                "index": index,
+                "name": color_names[index] if color_names is not None else None,
+                "area": int(counts[index]),
+                "bbox": bbox,
+                "mask": mask,
+            }
+        )
+
+    layers.sort(key=lambda layer: layer["area"], reverse=True)
+    return layers
+
+
+def uncrop_layer_mask(layer, shape):
+    """
+    Places a cropped layer mask back into a full-size mask.
+
+    Parameters:
+    - layer: A layer returned by segment_layers.
+    - shape: The (height, width) of the label map the layer comes from.
+
+    Returns:
+    - The full-size mask.
+    """
+    x, y, w, h = layer["bbox"]
+    mask = np.zeros(shape, dtype=np.uint8)
+    mask[y : y + h, x : x + w] = layer["mask"]
+    return mask
+
+
+def color_segmentation_labels(
+    labels, output_folder, color_names, packed_output_path=None
+):
+    """
+    Save a grayscale mask for each color present in a label map.
+
+    :param labels: A uint8 label map of indices into the preset colors.
+    :param output_folder: Folder to save the output images.
+    :param color_names: List of names corresponding to each color in the preset.
+    :param packed_output_path: Optional .npz path where all layers are also saved bit-packed
+        and cropped to their bounding boxes (see packed_masks.py). The vectorization can read
+        it in place of the output folder.
+    :return: The layer statistics, largest layer first: dictionaries with "index", "name",
+        "area" and "bbox" keys, as returned by segment_layers without the masks.
+    """
+    # Create output folder if it doesn't exist
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    layers = segment_layers(labels, len(color_names), color_names)
+    if packed_output_path is not None:
+        save_packed_masks(packed_output_path, pack_layers(layers, labels.shape))
+    for layer in layers:
+        output_path = os.path.join(output_folder, f"{layer['name']}.png")
+        cv2.imwrite(output_path, uncrop_layer_mask(layer, labels.shape))
+        del layer["mask"]
+    return layers
+
+
+def color_segmentation(
+    input_image_path, output_folder, preset_colors, color_names, packed_output_path=None
+):
     """
     Segment each color in the image and save grayscale representations only for colors present in the image.
 
@@ -12,24 +127,12 @@ def color_segmentation(input_image_path, output_folder, preset_colors, color_nam
     :param output_folder: Folder to save the output images.
     :param preset_colors: Preset array of colors.
     :param color_names: List of names corresponding to each color in the preset.
+    :param packed_output_path: Optional .npz path where the layers are also saved bit-packed.
+    :return: The statistics of the saved layers, largest first (see color_segmentation_labels).
     """
 
     # start_time = time.time()
 
-    def segment_color(image, color):
-        mask = cv2.inRange(image, color, color)
-        if np.any(mask):  # Check if the color is present in the image
-            grayscale = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-            # If the color is black, invert the grayscale image to make the mask visible
-            if np.all(color == [0, 0, 0]):
-                grayscale = 255 - grayscale  # Invert grayscale
-            # Apply a binary threshold to get a black and white image
-            # Set the threshold as 1 to make pixels strictly white or black
-            _, binary = cv2.threshold(grayscale, 1, 255, cv2.THRESH_BINARY)
-            return cv2.bitwise_and(binary, binary, mask=mask)
-        else:
-            return None
-
     # Read the image
     image = cv2.imread(input_image_path)
     if image is None:
@@ -38,55 +141,17 @@ def color_segmentation(input_image_path, output_folder, preset_colors, color_nam
     # Convert BGR to RGB
     image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
-    # Create output folder if it doesn't exist
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-
-    # Process each color and save the file only if the color is present
-    for color, name in zip(preset_colors, color_names):
-        segmented_image = segment_color(image, color)
-        if segmented_image is not None:  # Only save if the color is present
-            output_path = os.path.join(output_folder, f"{name}.png")
-            cv2.imwrite(output_path, segmented_image)
+    # Segment all colors from the label map at once
+    layers = color_segmentation_labels(
+        image_to_label_map(image, preset_colors),
+        output_folder,
+        color_names,
+        packed_output_path,
+    )
 
     # end_time = time.time()  # Record the end time
     # print(f"Color segmentation completed in {end_time - start_time:.2f} seconds.")
-
-
-# Preset List of colors from color_quantization.py
-preset_colors = np.array(
-    [
-        [0, 0, 0],  # Black
-        [135, 135, 135],  # Grey
-        [180, 20, 20],  # Red
-        [50, 160, 50],  # Green
-        [50, 50, 180],  # Blue
-        [60, 224, 224],  # Cyan
-        [125, 47, 228],  # Purple
-        [218, 218, 40],  # Yellow
-        [255, 137, 38],  # Orange
-        [243, 243, 243],  # Light Grey
-        [24, 69, 77],  # Teal
-        [0, 127, 255],  # Azure
-        [170, 90, 150],  # Pink
-    ]
-)
-
-color_names = [
-    "Black",
-    "Grey",
-    "Red",
-    "Green",
-    "Blue",
-    "Cyan",
-    "Purple",
-    "Yellow",
-    "Orange",
-    "Lightgrey",
-    "Teal",
-    "Azure",
-    "Pink",
-]
+    return layers
 
 
 # # Example usage
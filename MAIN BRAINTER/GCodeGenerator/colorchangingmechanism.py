@@ -76,12 +76,13 @@ def generate_pen_return_gcode(pen_y_position, lift_pen_height=20):
     ]
 
 
-def combine_gcode(folder_path, lift_pen_height=20):
+def combine_gcode_layers(layer_gcode, lift_pen_height=20):
     """
-    Combines G-code files from a directory, adding commands to pick up, lower, lift, and return pens as needed.
+    Combines the G-code of each color layer, adding commands to pick up, lower, lift, and return pens as needed.
 
     Parameters:
-    - folder_path: The path to the directory containing the G-code files.
+    - layer_gcode: A dictionary mapping color names to their G-code commands, each ending with a newline.
+      The layers are drawn in alphabetical order of their names.
     - lift_pen_height: How high to lift the pen after each pick-up or return.
 
     Returns:
@@ -95,18 +96,17 @@ def combine_gcode(folder_path, lift_pen_height=20):
         "G0 X2 Y10 ; Initial machine start position\n",
         "F1000\n",
     ]
-    sorted_files = [
-        f for f in sorted(os.listdir(folder_path)) if f.endswith("_gcode.txt")
-    ]
+    sorted_names = sorted(layer_gcode)
+    previous_pen_y_position = None
 
-    for filename in sorted_files:
-        # Ignore the specific file "Lightgrey_gcode.txt"
-        if filename in ["Lightgrey_gcode.txt"]:
+    for name in sorted_names:
+        # Ignore the Lightgrey layer
+        if name in ["Lightgrey"]:
             continue
-        color_name = filename.split("_")[0].capitalize()
+        color_name = name.split("_")[0].capitalize()
         if color_name in color_to_y_position:
             pen_y_position = color_to_y_position[color_name]
-            if not hasattr(combine_gcode, "previous_pen_y_position"):
+            if previous_pen_y_position is None:
                 # For the first pen, directly pick it up
                 combined_gcode.extend(
                     generate_pen_pickup_gcode(pen_y_position, lift_pen_height)
@@ -115,31 +115,48 @@ def combine_gcode(folder_path, lift_pen_height=20):
             else:
                 # Return the previous pen and pick the next one
                 combined_gcode.extend(
-                    generate_pen_return_gcode(
-                        combine_gcode.previous_pen_y_position, lift_pen_height
-                    )
+                    generate_pen_return_gcode(previous_pen_y_position, lift_pen_height)
                 )
                 combined_gcode.extend(
                     generate_pen_pickup_gcode(pen_y_position, lift_pen_height)
                 )
                 combined_gcode.append("G0 Z0 ; Lower pen to start drawing\n")
 
-            combined_gcode.extend(read_gcode_file(os.path.join(folder_path, filename)))
+            combined_gcode.extend(layer_gcode[name])
             combined_gcode.append("G0 Z40 ; Lift pen after drawing\n")
-            combine_gcode.previous_pen_y_position = pen_y_position
+            previous_pen_y_position = pen_y_position
 
-            if filename == sorted_files[-1]:  # After the last drawing, return the pen
+            if name == sorted_names[-1]:  # After the last drawing, return the pen
                 combined_gcode.extend(
                     generate_pen_return_gcode(pen_y_position, lift_pen_height)
                 )
         else:
-            print(f"Color '{color_name}' not recognized. Skipping file '{filename}'.")
+            print(f"Color '{color_name}' not recognized. Skipping layer '{name}'.")
 
     combined_gcode.append("G0 X2 Y10  ; Return to initial machine start position\n")
     combined_gcode.append("M5 ; Turning off spindle \n")
     return combined_gcode
 
 
+def combine_gcode(folder_path, lift_pen_height=20):
+    """
+    Combines G-code files from a directory, adding commands to pick up, lower, lift, and return pens as needed.
+
+    Parameters:
+    - folder_path: The path to the directory containing the G-code files.
+    - lift_pen_height: How high to lift the pen after each pick-up or return.
+
+    Returns:
+    - A list of combined G-code commands as strings.
+    """
+    layer_gcode = {
+        f[: -len("_gcode.txt")]: read_gcode_file(os.path.join(folder_path, f))
+        for f in sorted(os.listdir(folder_path))
+        if f.endswith("_gcode.txt")
+    }
+    return combine_gcode_layers(layer_gcode, lift_pen_height)
+
+
 def write_combined_gcode(combined_gcode, output_filename):
     with open(output_filename, "w") as file:
         file.writelines(combined_gcode)
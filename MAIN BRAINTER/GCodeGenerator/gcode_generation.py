@@ -2,43 +2,277 @@ import xml.etree.ElementTree as ET
 import os
 import time
 import glob
+import re
+import numpy as np
 
 
-def gcode_generation(input_directory, output_directory):
-    def parse_svg_file(svg_file_path):
-        ns = {"ns0": "http://www.w3.org/2000/svg"}
-        tree = ET.parse(svg_file_path)
-        root = tree.getroot()
-        lines = root.findall(".//ns0:line", ns)
-        return lines
+def parse_svg_file(svg_file_path):
+    ns = {"ns0": "http://www.w3.org/2000/svg"}
+    tree = ET.parse(svg_file_path)
+    root = tree.getroot()
+    # Lines, polylines and paths, in the order they are drawn
+    strokes = [
+        element
+        for element in root.iter()
+        if element.tag
+        in (
+            f"{{{ns['ns0']}}}line",
+            f"{{{ns['ns0']}}}polyline",
+            f"{{{ns['ns0']}}}path",
+        )
+    ]
+    return strokes
+
+
+def svg_element_points(element):
+    """
+    Reads the points of an SVG line or polyline element.
+
+    Parameters:
+    - element: A <line> or <polyline> element.
+
+    Returns:
+    - A list of (x, y) points, as strings.
+    """
+    if element.tag.endswith("polyline"):
+        return [tuple(point.split(",")) for point in element.get("points").split()]
+    return [
+        (element.get("x1"), element.get("y1")),
+        (element.get("x2"), element.get("y2")),
+    ]
+
+
+# Commands and numbers of the d attribute of an SVG <path> element, in the order they come.
+# Numbers may be separated by spaces, commas, their sign or a second decimal point, as in
+# "l1.5-2" or "M1.5.5".
+path_token = re.compile(
+    r"[MmLlHhVvZz]|[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?", re.ASCII
+)
+# Removes the separators of path data, to check that the tokens cover the rest
+path_separators = str.maketrans("", "", " ,\t\r\n")
+# Path coordinates are read in whole 0.0001 units, the precision of svg_writer.svg_units
+path_unit_scale = 10000
+# Kinds of path points
+path_draw, path_move, path_close = 0, 1, 2
+
+
+def path_axis_positions(is_set, values, closes, close_moves):
+    """
+    Adds up the coordinates of the points of a path along one axis.
+
+    Between two resets, a point giving an absolute coordinate or a close, the positions are a
+    cumulative sum of the relative steps. A close goes back to the position of the move
+    starting its subpath, which comes before it, so the closes are resolved in order.
+
+    Parameters:
+    - is_set: Whether each point gives an absolute coordinate along this axis.
+    - values: The absolute coordinate of each such point and the relative step of the others,
+      as integers.
+    - closes: The indices of the closes, in order.
+    - close_moves: For every close, the index of the move starting its subpath, -1 for the
+      origin.
+
+    Returns:
+    - The position of each point along the axis, as integers.
+    """
+    resets = is_set.copy()
+    resets[closes] = True
+    sums = np.cumsum(np.where(resets, 0, values))
+    last_reset = np.maximum.accumulate(np.where(resets, np.arange(values.size), -1))
+    # The steps since the last reset, whose position is the base of the point
+    offsets = sums - np.where(last_reset >= 0, sums[np.maximum(last_reset, 0)], 0)
+    bases = np.where(is_set, values, 0)
+
+    if closes.size:
+        # The move of a close sits on the base of its own last reset. When that reset is an
+        # earlier close, its base is only known once that close is resolved.
+        has_move = close_moves >= 0
+        move_resets = np.where(has_move, last_reset[np.maximum(close_moves, 0)], -1)
+        move_offsets = np.where(has_move, offsets[np.maximum(close_moves, 0)], 0)
+        chained = np.isin(move_resets, closes)
+        parents = np.searchsorted(closes, move_resets).tolist()
+        close_bases = (
+            np.where(move_resets >= 0, bases[np.maximum(move_resets, 0)], 0)
+            + move_offsets
+        ).tolist()
+        move_offsets = move_offsets.tolist()
+        for close in np.flatnonzero(chained).tolist():
+            close_bases[close] = close_bases[parents[close]] + move_offsets[close]
+        bases[closes] = close_bases
+    return np.where(last_reset >= 0, bases[np.maximum(last_reset, 0)], 0) + offsets
+
+
+def svg_path_strokes(path_data):
+    """
+    Reads the subpaths of the d attribute of an SVG <path> element as strokes.
+
+    The move, line, horizontal, vertical and close commands are supported, both absolute and
+    relative. The numbers are read in whole 0.0001 units, the precision svg_writer writes
+    them with, so relative coordinates add up exactly and give the same points as absolute
+    ones. The points of the whole path are added up with cumulative sums.
+
+    Parameters:
+    - path_data: The d attribute, such as "M9 101 h100 m-100 2 h100".
 
+    Returns:
+    - A list of strokes, one per subpath, each a list of (x, y) points as floats.
+    """
+    tokens = path_token.findall(path_data)
+    # The tokens one space apart as bytes, where a command is a letter and a number starts
+    # with a digit, sign or point
+    text = np.frombuffer(" ".join(tokens).encode("ascii"), dtype=np.uint8).copy()
+    if text.size - len(tokens) + 1 != len(path_data.translate(path_separators)):
+        raise ValueError(f"Unsupported SVG path data: {path_data[:80]}")
+    if not tokens:
+        return []
+    starts = np.append(0, np.flatnonzero(text == ord(" ")) + 1)
+    command_tokens = np.flatnonzero(text[starts] >= ord("A"))
+    if command_tokens.size == 0:
+        return []
+    letters = text[starts[command_tokens]]
+
+    # All the numbers in one go once the letters are blanked out, in whole units
+    text[starts[command_tokens]] = ord(" ")
+    numbers = np.zeros(0)
+    if len(tokens) > command_tokens.size:
+        numbers = np.fromstring(text.tobytes(), sep=" ")
+    if numbers.size and np.abs(numbers).max() >= 1e11:
+        raise ValueError(f"SVG path coordinates out of range: {path_data[:80]}")
+    units = np.append(np.rint(numbers * path_unit_scale).astype(np.int64), 0)
+
+    # The numbers of every command, and its points: a pair of numbers for M and L (the
+    # numbers after the first pair of a move draw lines), one number for H and V, and each Z
+    first_numbers = command_tokens - np.arange(command_tokens.size)
+    number_counts = np.append(first_numbers[1:], numbers.size) - first_numbers
+    upper = letters & np.uint8(0xDF)
+    is_pair = (upper == ord("M")) | (upper == ord("L"))
+    is_close = upper == ord("Z")
+    point_counts = np.where(is_pair, number_counts // 2, number_counts)
+    point_counts[is_close] = 1
+    point_commands = np.repeat(np.arange(letters.size), point_counts)
+    if point_commands.size == 0:
+        return []
+    point_indices = np.arange(point_commands.size) - np.repeat(
+        np.cumsum(point_counts) - point_counts, point_counts
+    )
+    upper, is_pair = upper[point_commands], is_pair[point_commands]
+    is_relative = letters[point_commands] != upper
+    x_numbers = first_numbers[point_commands] + np.where(
+        is_pair, 2 * point_indices, point_indices
+    )
+    kinds = np.where(
+        upper == ord("Z"),
+        path_close,
+        np.where((upper == ord("M")) & (point_indices == 0), path_move, path_draw),
+    )
+    x_given = is_pair | (upper == ord("H"))
+    y_given = is_pair | (upper == ord("V"))
+    # The unused numbers point past the end of units, at a 0
+    x_values = units[np.where(x_given, x_numbers, -1)]
+    y_values = units[np.where(is_pair, x_numbers + 1, np.where(y_given, x_numbers, -1))]
+
+    closes = np.flatnonzero(kinds == path_close)
+    moves = np.maximum.accumulate(
+        np.where(kinds == path_move, np.arange(kinds.size), -1)
+    )
+    x = path_axis_positions(x_given & ~is_relative, x_values, closes, moves[closes])
+    y = path_axis_positions(y_given & ~is_relative, y_values, closes, moves[closes])
+
+    # Closing a subpath that is already closed, or before any point, draws nothing
+    previous_kinds = np.append(path_close, kinds[:-1])
+    kept = (kinds != path_close) | (previous_kinds != path_close)
+    kinds, x, y = kinds[kept], x[kept], y[kept]
+    if kinds.size == 0:
+        return []
+    if kinds[0] != path_move:
+        # The first subpath starts at the origin when the path does not start with a move
+        kinds, x, y = np.append(path_move, kinds), np.append(0, x), np.append(0, y)
+
+    # A line drawn after a close starts a new subpath at the start of the closed one
+    restarts = (kinds == path_close) & np.append(kinds[1:] == path_draw, False)
+    repeats = 1 + restarts
+    kinds = np.repeat(kinds, repeats)
+    kinds[np.cumsum(repeats)[restarts] - 1] = path_move
+    points = list(
+        zip(
+            (np.repeat(x, repeats) / path_unit_scale).tolist(),
+            (np.repeat(y, repeats) / path_unit_scale).tolist(),
+        )
+    )
+    starts = np.flatnonzero(kinds == path_move).tolist()
+    # A subpath that is only a move draws nothing
+    return [
+        points[start:end]
+        for start, end in zip(starts, starts[1:] + [len(points)])
+        if end - start > 1
+    ]
+
+
+def svg_element_strokes(element):
+    """
+    Reads the strokes of an SVG line, polyline or path element.
+
+    Parameters:
+    - element: A <line>, <polyline> or <path> element.
+
+    Returns:
+    - A list of strokes, each a list of (x, y) points.
+    """
+    if element.tag.endswith("path"):
+        return svg_path_strokes(element.get("d"))
+    return [svg_element_points(element)]
+
+
+def lines_to_gcode(lines):
+    """
+    Converts strokes into G-code, lifting the pen between strokes.
+
+    Parameters:
+    - lines: An iterable of strokes, each a sequence of (x, y) points drawn without lifting
+      the pen, such as the hatch lines of vectorization_findcontours.hatch_lines
+      ((start_point, end_point) pairs) or the polylines of its outline mode.
+
+    Returns:
+    - A list of G-code commands as strings.
+    """
+    gcode = ["G90 ; Use absolute positioning", "G21 ; Set units to millimeters"]
+    for stroke in lines:
+        if len(stroke) > 2:  # Polyline
+            points = [(float(x), float(y)) for x, y in stroke]
+            gcode += [
+                "G0 Z40 ; Lift pen",
+                f"G0 X{points[0][0]} Y{points[0][1]} ; Move to start of polyline",
+                "G0 Z0 ; Lower pen",
+            ]
+            gcode += [f"G1 X{x} Y{y} ; Draw polyline" for x, y in points[1:]]
+            continue
+        (x1, y1), (x2, y2) = stroke
+        x1, y1, x2, y2 = float(x1), float(y1), float(x2), float(y2)
+        if x1 == x2:  # Vertical line
+            if y1 > y2:
+                y1, y2 = y2, y1  # Ensure y1 is always less than y2 for consistency
+            gcode += [
+                "G0 Z40 ; Lift pen",
+                f"G0 X{x1} Y{y1} ; Move to start of vertical line",
+                "G0 Z0 ; Lower pen",
+                f"G1 X{x2} Y{y2} ; Draw vertical line",
+            ]
+        else:  # Horizontal line or any line
+            gcode += [
+                "G0 Z40 ; Lift pen",
+                f"G0 X{x1} Y{y1} ; Move to start",
+                "G0 Z0 ; Lower pen",
+                f"G1 X{x2} Y{y2} ; Draw line",
+            ]
+    gcode.append("G0 Z40 ; Lift pen")
+    return gcode
+
+
+def gcode_generation(input_directory, output_directory):
     def svg_to_gcode(lines):
-        gcode = ["G90 ; Use absolute positioning", "G21 ; Set units to millimeters"]
-        for line in lines:
-            x1, y1, x2, y2 = (
-                float(line.get("x1")),
-                float(line.get("y1")),
-                float(line.get("x2")),
-                float(line.get("y2")),
-            )
-            if x1 == x2:  # Vertical line
-                if y1 > y2:
-                    y1, y2 = y2, y1  # Ensure y1 is always less than y2 for consistency
-                gcode += [
-                    "G0 Z40 ; Lift pen",
-                    f"G0 X{x1} Y{y1} ; Move to start of vertical line",
-                    "G0 Z0 ; Lower pen",
-                    f"G1 X{x2} Y{y2} ; Draw vertical line",
-                ]
-            else:  # Horizontal line or any line
-                gcode += [
-                    "G0 Z40 ; Lift pen",
-                    f"G0 X{x1} Y{y1} ; Move to start",
-                    "G0 Z0 ; Lower pen",
-                    f"G1 X{x2} Y{y2} ; Draw line",
-                ]
-        gcode.append("G0 Z40 ; Lift pen")
-        return gcode
+        return lines_to_gcode(
+            stroke for line in lines for stroke in svg_element_strokes(line)
+        )
 
     def generate_gcode_for_svg(svg_file_path, output_directory):
         lines = parse_svg_file(svg_file_path)
@@ -34,20 +34,24 @@ def optimized_drawing_order(commands):
     return optimized_order
 
 
-# Parse G-code and extract line drawing commands with their start and end positions
+# Parse G-code and extract drawing commands with their start and end positions.
+# Consecutive G1 moves without a G0 in between are one stroke and keep all their points.
 def parse_gcode(gcode_lines):
     commands = []
     current_pos = (0, 0)
+    stroke = None
     for line in gcode_lines:
-        if line.startswith("G0") and ("X" in line or "Y" in line):
-            parts = line.split()
-            for part in parts:
-                if part.startswith("X"):
-                    x = float(part[1:])
-                    current_pos = (x, current_pos[1])
-                elif part.startswith("Y"):
-                    y = float(part[1:])
-                    current_pos = (current_pos[0], y)
+        if line.startswith("G0"):
+            stroke = None
+            if "X" in line or "Y" in line:
+                parts = line.split()
+                for part in parts:
+                    if part.startswith("X"):
+                        x = float(part[1:])
+                        current_pos = (x, current_pos[1])
+                    elif part.startswith("Y"):
+                        y = float(part[1:])
+                        current_pos = (current_pos[0], y)
         elif line.startswith("G1") and ("X" in line or "Y" in line):
             parts = line.split()
             end_pos = current_pos
@@ -58,22 +62,38 @@ def parse_gcode(gcode_lines):
                 elif part.startswith("Y"):
                     y = float(part[1:])
                     end_pos = (end_pos[0], y)
-            commands.append({"start_pos": current_pos, "end_pos": end_pos})
+            if stroke is None:
+                stroke = {
+                    "start_pos": current_pos,
+                    "end_pos": end_pos,
+                    "points": [current_pos, end_pos],
+                }
+                commands.append(stroke)
+            else:
+                stroke["end_pos"] = end_pos
+                stroke["points"].append(end_pos)
             current_pos = end_pos
     return commands
 
 
-# Helper function to merge consecutive lines that are directly connected or separated by 1 in Y
+# Helper function to merge consecutive lines that are directly connected or separated by 1 in Y.
+# Polylines are never merged, their intermediate points would be lost.
 def merge_consecutive_lines(lines):
     merged_lines = []
     i = 0
     while i < len(lines):
         current_line = lines[i]
-        while i + 1 < len(lines) and can_merge(current_line, lines[i + 1]):
+        while (
+            i + 1 < len(lines)
+            and len(current_line["points"]) == 2
+            and len(lines[i + 1]["points"]) == 2
+            and can_merge(current_line, lines[i + 1])
+        ):
             next_line = lines[i + 1]
             current_line = {
                 "start_pos": current_line["start_pos"],
                 "end_pos": next_line["end_pos"],
+                "points": [current_line["start_pos"], next_line["end_pos"]],
             }
             i += 1
         merged_lines.append(current_line)
@@ -114,22 +134,27 @@ def generate_optimized_gcode(optimized_order):
                 f"G0 X{start_pos[0]} Y{start_pos[1]} ; Move to start"
             )
             optimized_gcode.append(f"G0 Z0 ; Lower pen to start drawing")
-        optimized_gcode.append(f"G1 X{end_pos[0]} Y{end_pos[1]} ; Draw line")
+        for point in line["points"][1:]:
+            optimized_gcode.append(f"G1 X{point[0]} Y{point[1]} ; Draw line")
         last_pos = end_pos
     optimized_gcode.append("G0 Z40 ; Lift pen after finishing")
     return optimized_gcode
 
 
+# Reorder and merge the drawing commands of one G-code program
+def optimize_gcode_lines(gcode_lines):
+    parsed_commands = parse_gcode(gcode_lines)
+    optimized_order = optimized_drawing_order(parsed_commands)
+    return generate_optimized_gcode(optimized_order)
+
+
 # Process a single G-code file
 def process_file(file_path):
     # Assuming this function is unchanged, except you might need to handle exceptions or issues within the file processing more gracefully
     try:
         with open(file_path, "r") as file:
             gcode_lines = file.readlines()
-        parsed_commands = parse_gcode(gcode_lines)
-        optimized_order = optimized_drawing_order(parsed_commands)
-        optimized_gcode = generate_optimized_gcode(optimized_order)
-        return optimized_gcode
+        return optimize_gcode_lines(gcode_lines)
     except Exception as e:
         print(f"Error processing {file_path}: {e}")
         return None
@@ -173,6 +198,25 @@ def gcode_optimization(source_folder_path, output_folder_path, max_workers=22):
                 print(f"{file} generated an exception: {exc}")
 
 
+def optimize_gcode_layers(layer_gcode, max_workers=22):
+    """
+    Optimizes in-memory G-code programs in parallel, without going through files.
+
+    Parameters:
+    - layer_gcode: A dictionary mapping layer names to lists of G-code commands.
+    - max_workers: The maximum number of worker processes.
+
+    Returns:
+    - A dictionary mapping the same layer names, in the same order, to the optimized G-code.
+    """
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            name: executor.submit(optimize_gcode_lines, gcode_lines)
+            for name, gcode_lines in layer_gcode.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+
 # if __name__ == "__main__":
 #     source_folder_path = "MAIN BRAINTER/GCodeGenerator/Assets/GCode/brainter"
 #     output_folder_path = "MAIN BRAINTER/GCodeGenerator/Assets/GCode/optimized"
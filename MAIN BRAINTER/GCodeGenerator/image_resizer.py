@@ -1,3 +1,5 @@
+import cv2
+import numpy as np
 from PIL import Image
 
 
@@ -15,6 +17,65 @@ def resize_image(input_path, output_path, scale=0.6):
         resized_img.save(output_path)
 
 
+def read_resized_image_rgb(input_path, scale=0.6):
+    """
+    Reads an image and resizes it like resize_image, without writing it back to disk.
+
+    Parameters:
+    - input_path: Path to the input image file.
+    - scale: The scaling factor applied to both sides.
+
+    Returns:
+    - The resized image as an RGB numpy array.
+    """
+    with Image.open(input_path) as img:
+        new_width = int(img.width * scale)
+        new_height = int(img.height * scale)
+        resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        return np.asarray(resized_img.convert("RGB"))
+
+
+def shrink_image(image, max_image_size=1024):
+    """
+    Downscales an image so that neither side is larger than max_image_size.
+
+    Parameters:
+    - image: The input image as a numpy array.
+    - max_image_size: The maximum size (width or height) of the returned image.
+
+    Returns:
+    - The resized image, or the input image itself if it is already small enough.
+    """
+    height, width = image.shape[:2]
+    if max(height, width) <= max_image_size:
+        return image
+    scaling_factor = max_image_size / max(height, width)
+    return cv2.resize(
+        image,
+        None,
+        fx=scaling_factor,
+        fy=scaling_factor,
+        interpolation=cv2.INTER_AREA,
+    )
+
+
+def load_image_rgb(input_image_path, max_image_size=1024):
+    """
+    Reads an image, downscales it to max_image_size and converts it to RGB.
+
+    Parameters:
+    - input_image_path: Path to the input image file.
+    - max_image_size: The maximum size (width or height) to which the image will be resized.
+
+    Returns:
+    - The image as an RGB numpy array.
+    """
+    image = cv2.imread(input_image_path)
+    if image is None:
+        raise ValueError("Could not read the image.")
+    return cv2.cvtColor(shrink_image(image, max_image_size), cv2.COLOR_BGR2RGB)
+
+
 # # Example usage
 # input_image_path = "MAIN BRAINTER/GCodeGenerator/Assets/Images/brainter.png"
 # output_image_path = "MAIN BRAINTER/GCodeGenerator/Assets/Images/brainter.png"
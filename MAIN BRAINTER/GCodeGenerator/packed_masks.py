@@ -0,0 +1,178 @@
+import cv2
+import numpy as np
+
+# Number of set bits in every byte value
+byte_bit_counts = np.array([bin(value).count("1") for value in range(256)])
+
+
+class PackedMask:
+    """
+    A binary layer mask stored bit-packed and cropped to its bounding box.
+
+    Eight pixels share one byte, and only the bounding box of the layer is kept, so a layer
+    takes at most 1/8 of the memory of the full 8-bit grayscale mask.
+
+    Parameters:
+    - packed: The bit-packed rows of the cropped mask, as returned by np.packbits(..., axis=1).
+    - bbox: The (x, y, width, height) of the cropped mask inside the full image.
+    - shape: The (height, width) of the full image.
+    """
+
+    def __init__(self, packed, bbox, shape):
+        self.packed = packed
+        self.bbox = tuple(int(value) for value in bbox)
+        self.shape = tuple(int(value) for value in shape)
+
+    @classmethod
+    def from_mask(cls, mask):
+        """
+        Packs a full-size mask, cropping it to the bounding box of its non-zero pixels.
+
+        Parameters:
+        - mask: A 2D mask where non-zero pixels belong to the layer.
+
+        Returns:
+        - A PackedMask.
+        """
+        x, y, w, h = cv2.boundingRect((mask > 0).astype(np.uint8))
+        return cls.from_cropped(mask[y : y + h, x : x + w], (x, y, w, h), mask.shape)
+
+    @classmethod
+    def from_cropped(cls, cropped_mask, bbox, shape):
+        """
+        Packs a mask that is already cropped to its bounding box.
+
+        Parameters:
+        - cropped_mask: A 2D mask covering bbox, non-zero inside the layer.
+        - bbox: The (x, y, width, height) of cropped_mask inside the full image.
+        - shape: The (height, width) of the full image.
+
+        Returns:
+        - A PackedMask.
+        """
+        return cls(np.packbits(cropped_mask > 0, axis=1), bbox, shape)
+
+    @classmethod
+    def from_layer(cls, layer, shape):
+        """
+        Packs a layer returned by color_segmentation.segment_layers.
+
+        Parameters:
+        - layer: A layer dictionary with "mask" and "bbox" keys.
+        - shape: The (height, width) of the label map the layer comes from.
+
+        Returns:
+        - A PackedMask.
+        """
+        return cls.from_cropped(layer["mask"], layer["bbox"], shape)
+
+    @property
+    def nbytes(self):
+        return self.packed.nbytes
+
+    @property
+    def area(self):
+        """
+        The number of pixels of the layer, counted on the packed bits.
+        """
+        return int(byte_bit_counts[self.packed].sum())
+
+    def rows(self, start=0, stop=None):
+        """
+        Unpacks a range of rows of the cropped mask.
+
+        Parameters:
+        - start: The first row, relative to the top of the bounding box.
+        - stop: The row after the last one, the bottom of the bounding box if None.
+
+        Returns:
+        - A uint8 array of the requested rows, 255 inside the layer and 0 outside.
+        """
+        rows = np.unpackbits(self.packed[start:stop], axis=1, count=self.bbox[2])
+        return rows * np.uint8(255)
+
+    def band(self, start, stop):
+        """
+        Takes a range of rows of the cropped mask as a PackedMask of its own, sharing the bits.
+
+        Parameters:
+        - start: The first row, relative to the top of the bounding box.
+        - stop: The row after the last one.
+
+        Returns:
+        - A PackedMask whose bounding box covers the rows start to stop.
+        """
+        x, y, w, h = self.bbox
+        start, stop, _ = slice(start, stop).indices(h)
+        return PackedMask(
+            self.packed[start:stop], (x, y + start, w, stop - start), self.shape
+        )
+
+    def to_array(self, full_size=True):
+        """
+        Unpacks the whole mask.
+
+        Parameters:
+        - full_size: Return the mask at the size of the full image instead of its bounding box.
+
+        Returns:
+        - A uint8 mask, 255 inside the layer and 0 outside.
+        """
+        cropped = self.rows()
+        if not full_size:
+            return cropped
+        x, y, w, h = self.bbox
+        mask = np.zeros(self.shape, dtype=np.uint8)
+        mask[y : y + h, x : x + w] = cropped
+        return mask
+
+
+def pack_layers(layers, shape):
+    """
+    Packs the layers returned by color_segmentation.segment_layers.
+
+    Parameters:
+    - layers: The list of layers, each with "name", "mask" and "bbox" keys.
+    - shape: The (height, width) of the label map the layers come from.
+
+    Returns:
+    - A dictionary mapping each layer name to its PackedMask, in the order of layers.
+    """
+    return {layer["name"]: PackedMask.from_layer(layer, shape) for layer in layers}
+
+
+def save_packed_masks(output_path, packed_masks):
+    """
+    Saves packed masks to a single compressed .npz file.
+
+    Parameters:
+    - output_path: Path of the .npz file.
+    - packed_masks: A dictionary mapping layer names to PackedMask objects.
+    """
+    arrays = {"names": np.array(list(packed_masks))}
+    for index, packed_mask in enumerate(packed_masks.values()):
+        arrays[f"packed_{index}"] = packed_mask.packed
+        arrays[f"bbox_{index}"] = np.array(packed_mask.bbox)
+        arrays[f"shape_{index}"] = np.array(packed_mask.shape)
+    np.savez_compressed(output_path, **arrays)
+
+
+def load_packed_masks(input_path):
+    """
+    Loads packed masks saved with save_packed_masks.
+
+    Parameters:
+    - input_path: Path of the .npz file.
+
+    Returns:
+    - A dictionary mapping layer names to PackedMask objects, in the saved order.
+    """
+    with np.load(input_path) as arrays:
+        return {
+            str(name): PackedMask(
+                arrays[f"packed_{index}"],
+                arrays[f"bbox_{index}"],
+                arrays[f"shape_{index}"],
+            )
+            for index, name in enumerate(arrays["names"])
+        }
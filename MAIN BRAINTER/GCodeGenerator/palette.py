@@ -0,0 +1,179 @@
+import hashlib
+import os
+import tempfile
+import threading
+import numpy as np
+from GCodeGenerator.palette_mapping import nearest_color_indices
+
+palette_cache_folder = "MAIN BRAINTER/GCodeGenerator/Assets/Palette Cache"
+
+
+class Palette:
+    """
+    A fixed set of pen colors with a precomputed RGB-to-color lookup table.
+
+    The table holds, for every quantized RGB value, the index of the closest palette color.
+    It is built once, saved as a .npy file keyed by the palette contents and memory-mapped
+    on later runs, so mapping an image costs one table read per pixel.
+
+    Parameters:
+    - colors: Array of RGB values representing the palette colors.
+    - names: Optional list of names corresponding to each color.
+    - bits: Bits kept per channel when indexing the table. 8 covers the full 24-bit space
+      and gives exact nearest-color results, 5 gives a 32x32x32 table.
+    - cache_folder: Folder where the lookup tables are stored, or None to keep them in memory only.
+    """
+
+    def __init__(self, colors, names=None, bits=8, cache_folder=palette_cache_folder):
+        if not 1 <= bits <= 8:
+            raise ValueError("bits must be between 1 and 8.")
+        self.colors = np.asarray(colors)
+        self.names = list(names) if names is not None else None
+        self.bits = bits
+        self.cache_folder = cache_folder
+        self._lookup_table = None
+        self._lookup_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.colors)
+
+    @property
+    def cache_key(self):
+        """
+        A digest of the palette contents and table resolution, used to name the cache file.
+        """
+        digest = hashlib.sha1(self.colors.astype(np.int64).tobytes())
+        digest.update(f"{self.colors.shape}:{self.bits}".encode())
+        return digest.hexdigest()[:16]
+
+    @property
+    def cache_path(self):
+        if self.cache_folder is None:
+            return None
+        return os.path.join(
+            self.cache_folder, f"palette_{self.cache_key}_{self.bits}bit.npy"
+        )
+
+    @property
+    def lookup_table(self):
+        """
+        The (levels, levels, levels) table of palette indices, loaded or built on first use.
+        """
+        if self._lookup_table is None:
+            with self._lookup_lock:
+                # Another thread may have loaded or built the table while this one waited
+                if self._lookup_table is None:
+                    cache_path = self.cache_path
+                    if cache_path is not None and os.path.exists(cache_path):
+                        self._lookup_table = np.load(cache_path, mmap_mode="r")
+                    else:
+                        self._lookup_table = self._build_lookup_table(cache_path)
+        return self._lookup_table
+
+    def _build_lookup_table(self, cache_path):
+        levels = 1 << self.bits
+        shift = 8 - self.bits
+        # Each table cell stands for the center of the RGB bin it covers
+        centers = (np.arange(levels) << shift) + ((1 << shift) >> 1)
+
+        if cache_path is None:
+            table = np.empty((levels, levels, levels), dtype=np.uint8)
+        else:
+            os.makedirs(self.cache_folder, exist_ok=True)
+            # A unique temporary file per build, so concurrent builds of the same table
+            # in other threads or processes never write to or rename each other's file
+            descriptor, temporary_path = tempfile.mkstemp(
+                suffix=".tmp.npy", dir=self.cache_folder
+            )
+            os.close(descriptor)
+            table = np.lib.format.open_memmap(
+                temporary_path,
+                mode="w+",
+                dtype=np.uint8,
+                shape=(levels, levels, levels),
+            )
+
+        # Fill one red plane at a time to keep the distance computation small
+        green, blue = np.meshgrid(centers, centers, indexing="ij")
+        plane = np.empty((levels, levels, 3), dtype=np.int64)
+        plane[..., 1] = green
+        plane[..., 2] = blue
+        for red_index, red in enumerate(centers):
+            plane[..., 0] = red
+            table[red_index] = nearest_color_indices(plane, self.colors)
+
+        if cache_path is None:
+            return table
+
+        table.flush()
+        del table
+        os.replace(temporary_path, cache_path)
+        return np.load(cache_path, mmap_mode="r")
+
+    def indices(self, image):
+        """
+        Maps every pixel of an RGB image to the index of its closest palette color.
+
+        Parameters:
+        - image: The input image as a uint8 numpy array with shape (..., 3).
+
+        Returns:
+        - A uint8 array with the shape of image minus the last axis.
+        """
+        image = np.asarray(image)
+        if image.dtype != np.uint8:
+            return nearest_color_indices(image, self.colors).astype(np.uint8)
+        shift = 8 - self.bits
+        if shift:
+            image = image >> shift
+        return self.lookup_table[image[..., 0], image[..., 1], image[..., 2]]
+
+    def apply(self, image):
+        """
+        Replaces every pixel of an RGB image by its closest palette color.
+
+        Parameters:
+        - image: The input image as a uint8 numpy array with shape (..., 3).
+
+        Returns:
+        - The mapped image as a uint8 array.
+        """
+        return self.colors.astype(np.uint8)[self.indices(image)]
+
+
+# Preset List of colors
+preset_colors = np.array(
+    [
+        [0, 0, 0],  # Black
+        [135, 135, 135],  # Grey
+        [180, 20, 20],  # Red
+        [50, 160, 50],  # Green
+        [50, 50, 180],  # Blue
+        [60, 224, 224],  # Cyan
+        [125, 47, 228],  # Purple
+        [218, 218, 40],  # Yellow
+        [255, 137, 38],  # Orange
+        [243, 243, 243],  # Light Grey
+        [24, 69, 77],  # Teal
+        [0, 127, 255],  # Azure
+        [170, 90, 150],  # Pink
+    ]
+)
+
+color_names = [
+    "Black",
+    "Grey",
+    "Red",
+    "Green",
+    "Blue",
+    "Cyan",
+    "Purple",
+    "Yellow",
+    "Orange",
+    "Lightgrey",
+    "Teal",
+    "Azure",
+    "Pink",
+]
+
+preset_palette = Palette(preset_colors, color_names)
@@ -0,0 +1,105 @@
+import numpy as np
+
+
+def nearest_color_indices(pixels, colors, chunk_size=65536):
+    """
+    Finds the index of the closest color for every pixel in a single batched pass.
+
+    The pixels are processed in chunks so the temporary distance matrix never grows
+    beyond chunk_size x len(colors) entries, whatever the size of the image.
+    Ties are resolved towards the lowest index, like np.argmin on the per-pixel distances.
+
+    Parameters:
+    - pixels: Array of RGB values with shape (..., 3).
+    - colors: An array of RGB colors to find the closest color from, shape (N, 3).
+    - chunk_size: The number of pixels compared against the colors at once.
+
+    Returns:
+    - An array with the shape of pixels minus the last axis, holding indices into colors.
+    """
+    pixels = np.asarray(pixels)
+    colors = np.asarray(colors)
+
+    # Squared distances give the same ordering as Euclidean distances, and integer
+    # inputs stay exact when the arithmetic is done in integers
+    if np.issubdtype(pixels.dtype, np.integer) and np.issubdtype(
+        colors.dtype, np.integer
+    ):
+        work_dtype = np.int64
+    else:
+        work_dtype = np.float64
+
+    flat_pixels = pixels.reshape((-1, 3))
+    palette = colors.astype(work_dtype)
+    indices = np.empty(flat_pixels.shape[0], dtype=np.intp)
+
+    for start in range(0, flat_pixels.shape[0], chunk_size):
+        chunk = flat_pixels[start : start + chunk_size].astype(work_dtype)
+        differences = chunk[:, None, :] - palette[None, :, :]
+        distances = np.einsum("ijk,ijk->ij", differences, differences)
+        indices[start : start + chunk_size] = np.argmin(distances, axis=1)
+
+    return indices.reshape(pixels.shape[:-1])
+
+
+def map_image_to_palette(image, colors, chunk_size=65536):
+    """
+    Replaces every pixel of an image by its closest color from a palette.
+
+    Parameters:
+    - image: The input image as a numpy array with shape (height, width, 3).
+    - colors: An array of RGB colors to map the image to.
+    - chunk_size: The number of pixels compared against the colors at once.
+
+    Returns:
+    - The image with each pixel replaced by the closest palette color, with the dtype of image.
+    """
+    indices = nearest_color_indices(image, colors, chunk_size)
+    return np.asarray(colors)[indices].astype(image.dtype)
+
+
+def map_image_through_centroids(image, centroids, mapped_colors, chunk_size=65536):
+    """
+    Replaces every pixel by the color its closest centroid maps to.
+
+    Each pixel is first assigned to its closest centroid, and each centroid is assigned to
+    its closest entry of mapped_colors. The second step only depends on the centroids, so
+    it is computed once per centroid instead of once per pixel.
+
+    Parameters:
+    - image: The input image as a numpy array with shape (height, width, 3).
+    - centroids: The centroids of the clusters as RGB values.
+    - mapped_colors: The colors the centroids are mapped to.
+    - chunk_size: The number of pixels compared against the centroids at once.
+
+    Returns:
+    - The image with each pixel replaced by the color of its closest centroid, with the dtype of image.
+    """
+    mapped_colors = np.asarray(mapped_colors)
+    centroid_to_color = nearest_color_indices(centroids, mapped_colors)
+    pixel_to_centroid = nearest_color_indices(image, centroids, chunk_size)
+    return mapped_colors[centroid_to_color[pixel_to_centroid]].astype(image.dtype)
+
+
+def label_image_through_centroids(image, centroids, colors, chunk_size=65536):
+    """
+    Labels every pixel with the index of the color its closest centroid maps to.
+
+    Each centroid is mapped to its closest color, and each pixel then takes the color that is
+    closest to its centroid among those mapped colors, like map_image_through_centroids.
+
+    Parameters:
+    - image: The input image as a numpy array with shape (height, width, 3).
+    - centroids: The centroids of the clusters as RGB values.
+    - colors: The palette the labels index into.
+    - chunk_size: The number of pixels compared against the centroids at once.
+
+    Returns:
+    - A uint8 label map with the shape of image minus the last axis, holding indices into colors.
+    """
+    colors = np.asarray(colors)
+    centroid_to_color = nearest_color_indices(centroids, colors)
+    mapped_colors = colors[centroid_to_color]
+    centroid_labels = centroid_to_color[nearest_color_indices(centroids, mapped_colors)]
+    pixel_to_centroid = nearest_color_indices(image, centroids, chunk_size)
+    return centroid_labels.astype(np.uint8)[pixel_to_centroid]
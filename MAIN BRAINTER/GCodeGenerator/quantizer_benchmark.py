@@ -0,0 +1,240 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import cv2
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from GCodeGenerator.palette import Palette, preset_colors, color_names
+from GCodeGenerator.quantizer_registry import quantizers, get_quantizer
+from GCodeGenerator.quantizer_selection import read_comparison_images
+from GCodeGenerator.similarityscore import structural_sim
+from GCodeGenerator.vectorization_findcontours import estimate_stroke_count
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where the peak memory is not measured
+    resource = None
+
+
+def peak_rss():
+    """
+    Reads the peak resident set size of the current process.
+
+    On Linux this is VmHWM from /proc/self/status, which reset_peak_rss can lower. getrusage
+    also keeps the peak of every thread that exited, so it never goes down.
+
+    Returns:
+    - The peak RSS in bytes, or None where neither source is available.
+    """
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def reset_peak_rss():
+    """
+    Lowers the peak resident set size of the current process to its current RSS, so peak_rss
+    only covers what runs afterwards. Only Linux supports this, elsewhere nothing happens.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+    except OSError:
+        pass
+
+
+def run_quantizer(backend, image, options):
+    """
+    Runs one quantizer backend and measures its wall time and peak memory.
+
+    Meant to run in a fresh process, so the peak RSS only covers this backend. The peak memory is
+    how far the peak RSS grew during the call, so it includes the C buffers of NumPy, OpenCV and
+    scikit-learn but not the interpreter, the imports or the input image. Where reset_peak_rss has
+    no effect, the allocations made while importing and receiving the image raise the starting
+    peak, and the figure is a lower bound.
+
+    Parameters:
+    - backend: The name of the backend, see quantizer_registry.quantizers.
+    - image: The input image as an RGB numpy array.
+    - options: Extra arguments for the quantizer.
+
+    Returns:
+    - A tuple (quantized_image, duration, peak_memory), peak_memory in bytes or None.
+    """
+    quantizer = get_quantizer(backend)
+    reset_peak_rss()
+    baseline = peak_rss()
+    start_time = time.perf_counter()
+    quantized_image = quantizer(image, preset_colors, **options)
+    duration = time.perf_counter() - start_time
+    peak = peak_rss()
+    peak_memory = None if peak is None else peak - baseline
+    return quantized_image, duration, peak_memory
+
+
+def count_strokes(
+    quantized_image,
+    preset_colors,
+    color_names,
+    line_spacing=1,
+    skipped_colors=("Lightgrey",),
+):
+    """
+    Estimates how many G-code strokes the hatch fill of a quantized image produces.
+
+    Each drawn color layer is estimated with vectorization_findcontours.estimate_stroke_count.
+
+    Parameters:
+    - quantized_image: The quantized image as an RGB numpy array of preset colors.
+    - preset_colors: Array of RGB values representing the preset colors.
+    - color_names: List of names corresponding to each color in the preset.
+    - line_spacing: The spacing between hatch lines.
+    - skipped_colors: Color layers that are not drawn (left out of the combined G-code).
+
+    Returns:
+    - The total number of strokes over all drawn layers.
+    """
+    labels = Palette(preset_colors).indices(quantized_image)
+    strokes = 0
+    for index, name in enumerate(color_names):
+        if name in skipped_colors:
+            continue
+        strokes += estimate_stroke_count(labels == index, line_spacing)
+    return strokes
+
+
+def benchmark_quantizers(
+    image_folder,
+    backends=None,
+    max_image_size=1024,
+    line_spacing=1,
+    quantizer_options=None,
+):
+    """
+    Runs every quantizer backend over a folder of images and measures cost and quality.
+
+    Each run happens in its own freshly spawned process, see run_quantizer.
+
+    Parameters:
+    - image_folder: Folder containing the test images.
+    - backends: Names of the backends to run, all registered backends if None.
+    - max_image_size: The maximum size (width or height) to which the images are resized.
+    - line_spacing: The hatch line spacing used to count G-code strokes.
+    - quantizer_options: Dictionary mapping backend names to extra quantizer arguments.
+
+    Returns:
+    - A list of dictionaries with the image, backend, wall time, peak memory (None where it is not
+      measured), SSIM and stroke count.
+    """
+    backends = list(backends or quantizers)
+    quantizer_options = quantizer_options or {}
+    # Build or load the palette lookup table up front so the first backend is not charged for it
+    Palette(preset_colors).lookup_table
+    results = []
+    for filename in sorted(os.listdir(image_folder)):
+        if not filename.lower().endswith((".png", ".jpg", ".jpeg")):
+            continue
+        image, original_gray = read_comparison_images(
+            os.path.join(image_folder, filename), max_image_size
+        )
+        for backend in backends:
+            with ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn")
+            ) as executor:
+                quantized_image, duration, peak_memory = executor.submit(
+                    run_quantizer, backend, image, quantizer_options.get(backend, {})
+                ).result()
+
+            quantized_gray = cv2.cvtColor(quantized_image, cv2.COLOR_RGB2GRAY)
+            results.append(
+                {
+                    "image": filename,
+                    "backend": backend,
+                    "time": duration,
+                    "peak_memory": peak_memory,
+                    "ssim": structural_sim(original_gray, quantized_gray),
+                    "strokes": count_strokes(
+                        quantized_image, preset_colors, color_names, line_spacing
+                    ),
+                }
+            )
+    return results
+
+
+def print_benchmark(results):
+    """
+    Prints the benchmark results per image and the average per backend.
+
+    The peak column is the growth of the peak RSS while the backend ran, see run_quantizer.
+
+    Parameters:
+    - results: The list returned by benchmark_quantizers.
+    """
+
+    def megabytes(values):
+        """
+        Formats the mean of peak memory values in MB, or n/a if any of them was not measured.
+        """
+        if any(value is None for value in values):
+            return f"{'n/a':>10}"
+        return f"{np.mean(values) / 2**20:>10.1f}"
+
+    header = f"{'image':<20} {'backend':<12} {'time (s)':>9} {'peak (MB)':>10} {'SSIM':>7} {'strokes':>8}"
+    print(header)
+    for result in results:
+        print(
+            f"{result['image']:<20} {result['backend']:<12} {result['time']:>9.3f} "
+            f"{megabytes([result['peak_memory']])} {result['ssim']:>7.4f} "
+            f"{result['strokes']:>8}"
+        )
+
+    print()
+    print(header)
+    for backend in dict.fromkeys(result["backend"] for result in results):
+        rows = [result for result in results if result["backend"] == backend]
+        print(
+            f"{'average':<20} {backend:<12} "
+            f"{np.mean([r['time'] for r in rows]):>9.3f} "
+            f"{megabytes([r['peak_memory'] for r in rows])} "
+            f"{np.mean([r['ssim'] for r in rows]):>7.4f} "
+            f"{np.mean([r['strokes'] for r in rows]):>8.0f}"
+        )
+
+
+# Run from the repository root, like main.py:
+# PYTHONPATH="MAIN BRAINTER" python -m GCodeGenerator.quantizer_benchmark "MAIN BRAINTER/GCodeGenerator/Assets/Images"
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the quantizer backends over a folder of images."
+    )
+    parser.add_argument("image_folder", help="Folder containing the test images.")
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=list(quantizers),
+        help="Backends to run (default: all).",
+    )
+    parser.add_argument("--max-image-size", type=int, default=1024)
+    parser.add_argument("--line-spacing", type=int, default=1)
+    args = parser.parse_args()
+
+    print_benchmark(
+        benchmark_quantizers(
+            args.image_folder,
+            args.backends,
+            args.max_image_size,
+            args.line_spacing,
+        )
+    )
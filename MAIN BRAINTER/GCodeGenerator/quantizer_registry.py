@@ -0,0 +1,123 @@
+import numpy as np
+from PIL import Image
+from GCodeGenerator.color_quantization_kmeans import (
+    quantize_image_kmeans,
+    quantize_labels_kmeans,
+)
+from GCodeGenerator.color_quantization_PCA import (
+    quantize_image_PCA,
+    quantize_labels_PCA,
+)
+from GCodeGenerator.palette import Palette
+from GCodeGenerator.palette_mapping import nearest_color_indices
+
+# Quantizer backends by name. Each one takes an RGB image and the preset colors and
+# returns an RGB image that only contains preset colors.
+quantizers = {}
+# Backends that can also return a palette-index label map directly
+label_quantizers = {}
+
+
+def register_quantizer(name, quantizer, label_quantizer=None):
+    """
+    Adds a quantizer backend to the registry.
+
+    Parameters:
+    - name: The name the backend is selected by.
+    - quantizer: A function taking (image, preset_colors, **options) and returning the quantized RGB image.
+    - label_quantizer: Optional function taking the same arguments and returning a tuple
+      (labels, palette) with a uint8 label map of indices into preset_colors.
+    """
+    quantizers[name] = quantizer
+    if label_quantizer is not None:
+        label_quantizers[name] = label_quantizer
+
+
+def get_quantizer(name):
+    """
+    Looks up a registered quantizer backend.
+
+    Parameters:
+    - name: The name of the backend.
+
+    Returns:
+    - The quantizer function.
+    """
+    if name not in quantizers:
+        raise ValueError(
+            f"Unknown quantizer '{name}'. Available: {', '.join(quantizers)}."
+        )
+    return quantizers[name]
+
+
+def get_label_quantizer(name):
+    """
+    Looks up a registered quantizer backend in its label map form.
+
+    Backends registered without a label quantizer are wrapped: their RGB output is turned
+    into labels with a palette lookup.
+
+    Parameters:
+    - name: The name of the backend.
+
+    Returns:
+    - A function taking (image, preset_colors, **options) and returning (labels, palette).
+    """
+    if name in label_quantizers:
+        return label_quantizers[name]
+    quantizer = get_quantizer(name)
+
+    def label_quantizer(image, preset_colors, **options):
+        quantized_image = quantizer(image, preset_colors, **options)
+        palette = Palette(preset_colors)
+        return palette.indices(quantized_image), palette.colors.astype(np.uint8)
+
+    return label_quantizer
+
+
+def quantize_image_PIL(image, preset_colors, method, num_colors=18):
+    """
+    Reduces the colors of an image with one of Pillow's quantizers and maps the result to the preset colors.
+
+    Parameters:
+    - image: The input image as an RGB numpy array.
+    - preset_colors: Array of RGB values representing the preset colors.
+    - method: The Pillow quantization method, such as Image.Quantize.MEDIANCUT.
+    - num_colors: The number of colors Pillow reduces the image to.
+
+    Returns:
+    - The quantized image as an RGB numpy array.
+    """
+    reduced = Image.fromarray(np.ascontiguousarray(image)).quantize(
+        colors=num_colors, method=method
+    )
+    indices = np.asarray(reduced)
+    palette = np.array(reduced.getpalette()[: 3 * (int(indices.max()) + 1)])
+    palette = palette.reshape((-1, 3))
+    # Only the few palette entries need a nearest-color search, not every pixel
+    palette_to_preset = nearest_color_indices(palette, preset_colors)
+    preset = np.asarray(preset_colors).astype(np.uint8)
+    return preset[palette_to_preset[indices]]
+
+
+def quantize_image_median_cut(image, preset_colors, num_colors=18):
+    return quantize_image_PIL(
+        image, preset_colors, Image.Quantize.MEDIANCUT, num_colors
+    )
+
+
+def quantize_image_octree(image, preset_colors, num_colors=18):
+    return quantize_image_PIL(
+        image, preset_colors, Image.Quantize.FASTOCTREE, num_colors
+    )
+
+
+def quantize_image_nearest(image, preset_colors):
+    return Palette(preset_colors).apply(image)
+
+
+register_quantizer("kmeans", quantize_image_kmeans, quantize_labels_kmeans)
+register_quantizer("PCA", quantize_image_PCA, quantize_labels_PCA)
+register_quantizer("median_cut", quantize_image_median_cut)
+register_quantizer("octree", quantize_image_octree)
+register_quantizer("nearest", quantize_image_nearest)
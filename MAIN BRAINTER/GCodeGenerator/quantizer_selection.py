@@ -0,0 +1,332 @@
+import cv2
+import os
+from concurrent.futures import ThreadPoolExecutor
+from GCodeGenerator.image_resizer import shrink_image
+from GCodeGenerator.color_quantization_kmeans import quantize_image_kmeans
+from GCodeGenerator.color_quantization_PCA import quantize_image_PCA
+from GCodeGenerator.similarityscore import structural_sim
+from GCodeGenerator.quantizer_registry import get_quantizer, get_label_quantizer
+
+
+def read_comparison_images(input_image_path, max_image_size=1024):
+    """
+    Decodes an image once and prepares the two views the quantizer comparison needs.
+
+    Parameters:
+    - input_image_path: Path to the input image file.
+    - max_image_size: The maximum size (width or height) of the image handed to the quantizers.
+
+    Returns:
+    - A tuple (image, original_gray): the downscaled read-only RGB image and the full-size grayscale original.
+    """
+    original = cv2.imread(input_image_path)
+    if original is None:
+        raise ValueError("Could not read the image.")
+    original_gray = cv2.cvtColor(original, cv2.COLOR_BGR2GRAY)
+    image = cv2.cvtColor(shrink_image(original, max_image_size), cv2.COLOR_BGR2RGB)
+    # The workers share this buffer, so make sure none of them can write to it
+    image.setflags(write=False)
+    return image, original_gray
+
+
+def quantize_and_score(
+    quantizer, image, original_gray, preset_colors, output_image_path=None, **kwargs
+):
+    """
+    Runs one quantizer on an in-memory image and scores the result against the original with SSIM.
+
+    Parameters:
+    - quantizer: An in-memory quantizer such as quantize_image_kmeans or quantize_image_PCA.
+    - image: The RGB image to quantize.
+    - original_gray: The grayscale original the result is compared to.
+    - preset_colors: Array of RGB values representing the preset colors.
+    - output_image_path: Optional path where the quantized image is saved.
+    - kwargs: Extra arguments passed to the quantizer.
+
+    Returns:
+    - A tuple (quantized_image, ssim) with the quantized RGB image and its SSIM score.
+    """
+    quantized_image = quantizer(image, preset_colors, **kwargs)
+    quantized_bgr = cv2.cvtColor(quantized_image, cv2.COLOR_RGB2BGR)
+    if output_image_path is not None:
+        cv2.imwrite(output_image_path, quantized_bgr)
+    quantized_gray = cv2.cvtColor(quantized_bgr, cv2.COLOR_BGR2GRAY)
+    return quantized_image, structural_sim(original_gray, quantized_gray)
+
+
+def compare_quantizers_concurrently(
+    input_image_path,
+    output_image_path_kmeans,
+    output_image_path_PCA,
+    preset_colors,
+    max_image_size=1024,
+    kmeans_options=None,
+    PCA_options=None,
+):
+    """
+    Quantizes an image with K-means and PCA at the same time and scores both with SSIM.
+
+    The image is decoded once. Both quantizers run in worker threads that share the decoded
+    buffer without copying it; NumPy, scikit-learn and OpenCV release the GIL for the heavy
+    work, so the comparison takes about as long as the slower quantizer.
+
+    Parameters:
+    - input_image_path: Path to the input image file.
+    - output_image_path_kmeans: Path where the K-means result will be saved.
+    - output_image_path_PCA: Path where the PCA result will be saved.
+    - preset_colors: Array of RGB values representing the preset colors.
+    - max_image_size: The maximum size (width or height) to which the image will be resized.
+    - kmeans_options: Extra arguments passed to quantize_image_kmeans.
+    - PCA_options: Extra arguments passed to quantize_image_PCA.
+
+    Returns:
+    - A dictionary with the SSIM score of each method, keyed "kmeans" and "PCA".
+    """
+    image, original_gray = read_comparison_images(input_image_path, max_image_size)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        kmeans_future = executor.submit(
+            quantize_and_score,
+            quantize_image_kmeans,
+            image,
+            original_gray,
+            preset_colors,
+            output_image_path_kmeans,
+            **(kmeans_options or {}),
+        )
+        PCA_future = executor.submit(
+            quantize_and_score,
+            quantize_image_PCA,
+            image,
+            original_gray,
+            preset_colors,
+            output_image_path_PCA,
+            **(PCA_options or {}),
+        )
+        _, ssim_kmeans = kmeans_future.result()
+        _, ssim_PCA = PCA_future.result()
+
+    return {"kmeans": ssim_kmeans, "PCA": ssim_PCA}
+
+
+def select_quantizer_by_proxy(
+    input_image_path,
+    output_image_paths,
+    preset_colors,
+    max_image_size=1024,
+    proxy_size=256,
+    quantizer_options=None,
+):
+    """
+    Picks the quantizer on a downsampled proxy and runs only the winner at full resolution.
+
+    Every candidate quantizes a proxy no larger than proxy_size and is scored with SSIM against
+    the proxy. The method with the best score then quantizes the max_image_size image, so the
+    losing methods never run at full resolution.
+
+    Parameters:
+    - input_image_path: Path to the input image file.
+    - output_image_paths: Dictionary mapping each candidate method name to the path where its
+      result is saved if it wins.
+    - preset_colors: Array of RGB values representing the preset colors.
+    - max_image_size: The maximum size (width or height) of the full-resolution image.
+    - proxy_size: The maximum size (width or height) of the proxy image.
+    - quantizer_options: Dictionary mapping method names to extra quantizer arguments.
+
+    Returns:
+    - A tuple (method, proxy_scores) with the winning method name and the SSIM of every candidate on the proxy.
+    """
+    quantizer_options = quantizer_options or {}
+    image, _ = read_comparison_images(input_image_path, max_image_size)
+    proxy = shrink_image(image, proxy_size)
+    proxy_gray = cv2.cvtColor(proxy, cv2.COLOR_RGB2GRAY)
+
+    proxy_scores = {}
+    for method in output_image_paths:
+        _, proxy_scores[method] = quantize_and_score(
+            get_quantizer(method),
+            proxy,
+            proxy_gray,
+            preset_colors,
+            **quantizer_options.get(method, {}),
+        )
+    method = max(proxy_scores, key=proxy_scores.get)
+
+    quantized_image = get_quantizer(method)(
+        image, preset_colors, **quantizer_options.get(method, {})
+    )
+    cv2.imwrite(
+        output_image_paths[method], cv2.cvtColor(quantized_image, cv2.COLOR_RGB2BGR)
+    )
+    return method, proxy_scores
+
+
+def quantize_labels_and_score(
+    label_quantizer, image, original_gray, preset_colors, **kwargs
+):
+    """
+    Runs one label quantizer on an in-memory image and scores the result against the original with SSIM.
+
+    Parameters:
+    - label_quantizer: A quantizer returning (labels, palette), see quantizer_registry.get_label_quantizer.
+    - image: The RGB image to quantize.
+    - original_gray: The grayscale original the result is compared to.
+    - preset_colors: Array of RGB values representing the preset colors.
+    - kwargs: Extra arguments passed to the quantizer.
+
+    Returns:
+    - A tuple (labels, palette, ssim) with the label map, its RGB palette and the SSIM score.
+    """
+    labels, palette = label_quantizer(image, preset_colors, **kwargs)
+    quantized_gray = cv2.cvtColor(palette[labels], cv2.COLOR_RGB2GRAY)
+    return labels, palette, structural_sim(original_gray, quantized_gray)
+
+
+def select_quantized_labels(
+    image,
+    original_gray,
+    preset_colors,
+    quantization_mode="sequential",
+    methods=("kmeans", "PCA"),
+    proxy_size=256,
+    quantizer_options=None,
+):
+    """
+    Quantizes an in-memory image with the best of several methods and returns its label map.
+
+    This is the in-memory counterpart of the quantization step of TopG: nothing is written to
+    disk and the winner's label map is handed straight to the segmentation.
+
+    Parameters:
+    - image: The RGB image to quantize.
+    - original_gray: The grayscale original the results are compared to.
+    - preset_colors: Array of RGB values representing the preset colors.
+    - quantization_mode: "sequential" runs the methods one after the other, "concurrent" runs
+      them in worker threads, "proxy" scores them on a downsampled proxy and only runs the
+      winner at full resolution.
+    - methods: The candidate method names. On equal scores the first one wins.
+    - proxy_size: The maximum size (width or height) of the proxy image.
+    - quantizer_options: Dictionary mapping method names to extra quantizer arguments.
+
+    Returns:
+    - A tuple (method, labels, palette, scores) with the winning method, its label map and
+      palette, and the SSIM of every method (on the proxy in "proxy" mode).
+    """
+    quantizer_options = quantizer_options or {}
+    results = {}
+    if quantization_mode == "sequential":
+        for method in methods:
+            results[method] = quantize_labels_and_score(
+                get_label_quantizer(method),
+                image,
+                original_gray,
+                preset_colors,
+                **quantizer_options.get(method, {}),
+            )
+    elif quantization_mode == "concurrent":
+        with ThreadPoolExecutor(max_workers=len(methods)) as executor:
+            futures = {
+                method: executor.submit(
+                    quantize_labels_and_score,
+                    get_label_quantizer(method),
+                    image,
+                    original_gray,
+                    preset_colors,
+                    **quantizer_options.get(method, {}),
+                )
+                for method in methods
+            }
+            results = {method: future.result() for method, future in futures.items()}
+    elif quantization_mode == "proxy":
+        proxy = shrink_image(image, proxy_size)
+        proxy_gray = cv2.cvtColor(proxy, cv2.COLOR_RGB2GRAY)
+        for method in methods:
+            results[method] = quantize_labels_and_score(
+                get_label_quantizer(method),
+                proxy,
+                proxy_gray,
+                preset_colors,
+                **quantizer_options.get(method, {}),
+            )
+    else:
+        raise ValueError(f"Unknown quantization_mode '{quantization_mode}'.")
+
+    scores = {method: result[2] for method, result in results.items()}
+    method = max(scores, key=scores.get)
+    if quantization_mode == "proxy":
+        labels, palette = get_label_quantizer(method)(
+            image, preset_colors, **quantizer_options.get(method, {})
+        )
+    else:
+        labels, palette, _ = results[method]
+    return method, labels, palette, scores
+
+
+def evaluate_proxy_selection(
+    image_folder,
+    preset_colors,
+    methods=("kmeans", "PCA"),
+    max_image_size=1024,
+    proxy_size=256,
+    quantizer_options=None,
+):
+    """
+    Measures how often the proxy picks a different quantizer than the full-resolution comparison.
+
+    Parameters:
+    - image_folder: Folder containing the test images.
+    - preset_colors: Array of RGB values representing the preset colors.
+    - methods: The candidate method names.
+    - max_image_size: The maximum size (width or height) of the full-resolution image.
+    - proxy_size: The maximum size (width or height) of the proxy image.
+    - quantizer_options: Dictionary mapping method names to extra quantizer arguments.
+
+    Returns:
+    - A list with, for each image, a dictionary holding the file name, both choices and all scores.
+    """
+    quantizer_options = quantizer_options or {}
+    results = []
+    for filename in sorted(os.listdir(image_folder)):
+        if not filename.lower().endswith((".png", ".jpg", ".jpeg")):
+            continue
+        image, original_gray = read_comparison_images(
+            os.path.join(image_folder, filename), max_image_size
+        )
+        proxy = shrink_image(image, proxy_size)
+        proxy_gray = cv2.cvtColor(proxy, cv2.COLOR_RGB2GRAY)
+
+        proxy_scores, full_scores = {}, {}
+        for method in methods:
+            options = quantizer_options.get(method, {})
+            _, proxy_scores[method] = quantize_and_score(
+                get_quantizer(method), proxy, proxy_gray, preset_colors, **options
+            )
+            _, full_scores[method] = quantize_and_score(
+                get_quantizer(method), image, original_gray, preset_colors, **options
+            )
+
+        result = {
+            "filename": filename,
+            "proxy_choice": max(proxy_scores, key=proxy_scores.get),
+            "full_choice": max(full_scores, key=full_scores.get),
+            "proxy_scores": proxy_scores,
+            "full_scores": full_scores,
+        }
+        results.append(result)
+        print(
+            f"{filename}: proxy picked {result['proxy_choice']}, "
+            f"full resolution picked {result['full_choice']}"
+        )
+
+    disagreements = sum(r["proxy_choice"] != r["full_choice"] for r in results)
+    print(
+        f"Proxy choice differed from the full-resolution choice on "
+        f"{disagreements} of {len(results)} images."
+    )
+    return results
+
+
+# # Example usage
+# if __name__ == "__main__":
+#     image_folder = "MAIN BRAINTER/GCodeGenerator/Assets/Images"
+#     evaluate_proxy_selection(image_folder, preset_colors)
@@ -0,0 +1,140 @@
+import cv2
+import numpy as np
+import os
+from GCodeGenerator.vectorization_findcontours import estimate_stroke_count
+
+
+def remove_specks(
+    mask, min_region_area=16, kernel_size=0, min_hole_area=None, line_spacing=1
+):
+    """
+    Removes the regions of a layer mask that are too small to be worth drawing.
+
+    Connected regions smaller than min_region_area are dropped and holes smaller than
+    min_hole_area are filled, since every speck and every small hole costs its own pen lift
+    and travel when the layer is hatched.
+
+    With a kernel_size above 1 the mask is first opened with an elliptical kernel, which also
+    trims short spurs off the regions. The opening erases every line thinner than the kernel,
+    so the pixels it removes are put back where they form a connected piece of at least
+    min_region_area pixels: long thin lines are kept and only the small bits are trimmed.
+
+    Everything outside the mask counts as empty, so a mask cropped to its bounding box is
+    filtered exactly like the full-size mask.
+
+    Parameters:
+    - mask: A 2D layer mask where non-zero pixels belong to the layer.
+    - min_region_area: Connected regions (8-connectivity) with fewer pixels are removed.
+    - kernel_size: The size of the opening kernel, 0 or 1 to skip the opening.
+    - min_hole_area: Holes with fewer pixels are filled, min_region_area if None.
+    - line_spacing: The hatch line spacing used to estimate the pen lifts saved.
+
+    Returns:
+    - A tuple (filtered_mask, stats). filtered_mask is a uint8 mask (255 inside, 0 outside)
+      and stats is a dictionary with the number of "components_removed" and "holes_filled",
+      and the estimated "pen_lifts_removed".
+    """
+    if min_hole_area is None:
+        min_hole_area = min_region_area
+    binary = np.where(mask > 0, 255, 0).astype(np.uint8)
+    num_components, component_labels = cv2.connectedComponents(binary, connectivity=8)
+
+    filtered = binary.copy()
+    if kernel_size > 1:
+        kernel = cv2.getStructuringElement(
+            cv2.MORPH_ELLIPSE, (kernel_size, kernel_size)
+        )
+        filtered = cv2.morphologyEx(
+            filtered,
+            cv2.MORPH_OPEN,
+            kernel,
+            borderType=cv2.BORDER_CONSTANT,
+            borderValue=0,
+        )
+        # Put back the pieces of thin lines the opening erased
+        _, piece_labels, stats, _ = cv2.connectedComponentsWithStats(
+            cv2.subtract(binary, filtered), connectivity=8
+        )
+        large_pieces = stats[:, cv2.CC_STAT_AREA] >= min_region_area
+        large_pieces[0] = False  # pixels kept by the opening
+        filtered[large_pieces[piece_labels]] = 255
+
+    # Drop the regions that are too small
+    _, region_labels, stats, _ = cv2.connectedComponentsWithStats(
+        filtered, connectivity=8
+    )
+    small_regions = stats[:, cv2.CC_STAT_AREA] < min_region_area
+    small_regions[0] = False  # background
+    filtered[small_regions[region_labels]] = 0
+
+    # Fill the small holes. The mask is padded so the empty area around the shapes forms a
+    # single background component that touches the border and is never filled.
+    padded = cv2.copyMakeBorder(filtered, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+    _, hole_labels, stats, _ = cv2.connectedComponentsWithStats(
+        cv2.bitwise_not(padded), connectivity=4
+    )
+    small_holes = stats[:, cv2.CC_STAT_AREA] < min_hole_area
+    small_holes[0] = False  # the shapes themselves
+    small_holes[hole_labels[0, 0]] = False  # the area around the shapes
+    filtered[small_holes[hole_labels[1:-1, 1:-1]]] = 255
+
+    # A component of the original mask is removed when none of its pixels survived
+    surviving = np.bincount(component_labels[filtered > 0], minlength=num_components)
+    return filtered, {
+        "components_removed": int(np.count_nonzero(surviving[1:] == 0)),
+        "holes_filled": int(np.count_nonzero(small_holes)),
+        "pen_lifts_removed": estimate_stroke_count(binary, line_spacing)
+        - estimate_stroke_count(filtered, line_spacing),
+    }
+
+
+def print_speck_report(report):
+    """
+    Prints what the speck filtering removed per layer and in total.
+
+    Parameters:
+    - report: A dictionary mapping layer names to the stats returned by remove_specks.
+    """
+    for name, stats in report.items():
+        print(
+            f"{name}: removed {stats['components_removed']} components, "
+            f"filled {stats['holes_filled']} holes, "
+            f"saved ~{stats['pen_lifts_removed']} pen lifts"
+        )
+    print(
+        f"Speck filtering removed {sum(s['components_removed'] for s in report.values())} "
+        f"components and ~{sum(s['pen_lifts_removed'] for s in report.values())} pen lifts."
+    )
+
+
+def speck_filtering(input_folder, **options):
+    """
+    Removes the specks from every segmented image in a folder, in place.
+
+    Images left empty are deleted, so no pen is picked up for a layer with nothing to draw.
+
+    Parameters:
+    - input_folder: Folder containing the segmented grayscale masks.
+    - options: Extra arguments passed to remove_specks.
+
+    Returns:
+    - A dictionary mapping each image name (without extension) to its remove_specks stats.
+    """
+    report = {}
+    for filename in sorted(os.listdir(input_folder)):
+        if not filename.lower().endswith((".png", ".jpg", ".jpeg")):
+            continue
+        image_path = os.path.join(input_folder, filename)
+        mask = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        filtered, report[os.path.splitext(filename)[0]] = remove_specks(mask, **options)
+        if filtered.any():
+            cv2.imwrite(image_path, filtered)
+        else:
+            os.remove(image_path)
+    print_speck_report(report)
+    return report
+
+
+# # Example usage
+# input_folder = "MAIN BRAINTER/GCodeGenerator/Assets/Segmented Images"
+# speck_filtering(input_folder, min_region_area=16)
@@ -0,0 +1,203 @@
+import io
+
+
+def svg_number(value):
+    """
+    Formats a number the way svgwrite does for the tiny profile, floats rounded to 4 decimals.
+
+    Parameters:
+    - value: An int or float, including numpy scalars.
+
+    Returns:
+    - The number as a string.
+    """
+    if isinstance(value, float):
+        value = round(value, 4)
+    return str(value)
+
+
+def svg_units(value):
+    """
+    Converts a number to a whole number of 0.0001 units, the precision of svg_number.
+
+    Parameters:
+    - value: An int or float, including numpy scalars.
+
+    Returns:
+    - The number of units as an int.
+    """
+    return round(round(float(value), 4) * 10000)
+
+
+def svg_units_number(units):
+    """
+    Formats a whole number of 0.0001 units as a short SVG number, without trailing zeros.
+
+    Parameters:
+    - units: The number of units.
+
+    Returns:
+    - The number as a string.
+    """
+    whole, fraction = divmod(abs(units), 10000)
+    sign = "-" if units < 0 else ""
+    if fraction == 0:
+        return f"{sign}{whole}"
+    return f"{sign}{whole}.{fraction:04d}".rstrip("0")
+
+
+# Output formats of StreamingSVGWriter
+svg_formats = ("lines", "path")
+
+
+class StreamingSVGWriter:
+    """
+    Writes pen strokes to an SVG file as they are produced, without building a document tree.
+
+    The file is byte for byte what svgwrite.Drawing(profile="tiny").save() writes for the same
+    black background and white strokes, so gcode_generation.parse_svg_file reads it the same
+    way. No attribute is validated, the strokes are expected to hold plain numbers.
+
+    The "path" format is a compact alternative: all the strokes go into a single <path>
+    element, each stroke a subpath in relative coordinates ("m" to move to its start, then
+    "h", "v" or "l" per point, "z" to close a ring). The coordinates are the same numbers as
+    in the "lines" format, and the differences are computed in whole 0.0001 units so reading
+    them back gives the same points.
+
+    Use it as a context manager, the closing </svg> tag is written on exit.
+
+    Parameters:
+    - svg_path: Path where the SVG file will be saved.
+    - width: The width of the drawing.
+    - height: The height of the drawing.
+    - line_thickness: The thickness of the lines.
+    - svg_format: "lines" for <line> and <polyline> elements, "path" for a single <path>.
+    """
+
+    def __init__(self, svg_path, width, height, line_thickness=1, svg_format="lines"):
+        if svg_format not in svg_formats:
+            raise ValueError(
+                f"Unknown SVG format '{svg_format}'. Available: {', '.join(svg_formats)}."
+            )
+        self.svg_path = svg_path
+        self.width = width
+        self.height = height
+        self.svg_format = svg_format
+        self.stroke_attributes = (
+            f'stroke="white" stroke-width="{svg_number(line_thickness)}"'
+        )
+        self.file = None
+        # The current point of the path, where the previous subpath ended
+        self.current_point = None
+
+    def __enter__(self):
+        width, height = svg_number(self.width), svg_number(self.height)
+        self.file = io.open(self.svg_path, mode="w", encoding="utf-8")
+        self.file.write(
+            '<?xml version="1.0" encoding="utf-8" ?>\n'
+            f'<svg baseProfile="tiny" height="{height}" version="1.2" width="{width}" '
+            'xmlns="http://www.w3.org/2000/svg" '
+            'xmlns:ev="http://www.w3.org/2001/xml-events" '
+            'xmlns:xlink="http://www.w3.org/1999/xlink">'
+            f'<defs /><rect fill="black" height="{height}" width="{width}" x="0" y="0" />'
+        )
+        if self.svg_format == "path":
+            self.file.write('<path d="')
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.svg_format == "path":
+            self.file.write(f'" fill="none" {self.stroke_attributes} />')
+        self.file.write("</svg>")
+        self.file.close()
+
+    def stroke_element(self, stroke):
+        """
+        Formats one stroke, as a <line> for two points and as a <polyline> otherwise.
+
+        Parameters:
+        - stroke: A sequence of (x, y) points.
+
+        Returns:
+        - The element as a string.
+        """
+        if len(stroke) == 2:
+            (x1, y1), (x2, y2) = stroke
+            return (
+                f'<line {self.stroke_attributes} x1="{svg_number(x1)}" '
+                f'x2="{svg_number(x2)}" y1="{svg_number(y1)}" y2="{svg_number(y2)}" />'
+            )
+        points = " ".join(f"{svg_number(x)},{svg_number(y)}" for x, y in stroke)
+        return f'<polyline fill="none" points="{points}" {self.stroke_attributes} />'
+
+    def subpath(self, stroke):
+        """
+        Formats one stroke as a subpath of the path, relative to the end of the previous one.
+
+        Parameters:
+        - stroke: A sequence of (x, y) points.
+
+        Returns:
+        - The path commands as a string, starting with a space after the first subpath.
+        """
+        points = [(svg_units(x), svg_units(y)) for x, y in stroke]
+        closed = len(points) > 2 and points[0] == points[-1]
+        if closed:
+            points.pop()
+        x, y = points[0]
+        if self.current_point is None:
+            commands = [f"M{svg_units_number(x)} {svg_units_number(y)}"]
+        else:
+            dx, dy = x - self.current_point[0], y - self.current_point[1]
+            commands = [f" m{svg_units_number(dx)} {svg_units_number(dy)}"]
+        for next_x, next_y in points[1:]:
+            dx, dy = next_x - x, next_y - y
+            if dy == 0:
+                commands.append(f"h{svg_units_number(dx)}")
+            elif dx == 0:
+                commands.append(f"v{svg_units_number(dy)}")
+            else:
+                commands.append(f"l{svg_units_number(dx)} {svg_units_number(dy)}")
+            x, y = next_x, next_y
+        if closed:
+            commands.append("z")
+            x, y = points[0]
+        self.current_point = (x, y)
+        return " ".join(commands)
+
+    def write_strokes(self, strokes):
+        """
+        Writes strokes to the file one by one, in order.
+
+        Parameters:
+        - strokes: An iterable of strokes, such as a generator producing them.
+        """
+        if self.svg_format == "path":
+            self.file.writelines(self.subpath(stroke) for stroke in strokes)
+        else:
+            self.file.writelines(self.stroke_element(stroke) for stroke in strokes)
+
+
+def write_svg_stream(
+    svg_path, strokes, width, height, line_thickness=1, svg_format="lines"
+):
+    """
+    Saves pen strokes as an SVG drawing on a black background, see StreamingSVGWriter.
+
+    Parameters:
+    - svg_path: Path where the SVG file will be saved.
+    - strokes: An iterable of strokes, each a sequence of (x, y) points.
+    - width: The width of the drawing.
+    - height: The height of the drawing.
+    - line_thickness: The thickness of the lines.
+    - svg_format: "lines" or "path", see StreamingSVGWriter.
+    """
+    with StreamingSVGWriter(
+        svg_path, width, height, line_thickness, svg_format
+    ) as writer:
+        writer.write_strokes(strokes)
+
+
+# # Example usage
+# with StreamingSVGWriter("layer.svg", 120, 80, svg_format="path") as writer:
+#     writer.write_strokes([((0, 0), (10, 0)), ((0, 2), (5, 4), (10, 2))])
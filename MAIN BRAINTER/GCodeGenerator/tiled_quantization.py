@@ -0,0 +1,238 @@
+import os
+import shutil
+import tempfile
+import cv2
+import numpy as np
+from PIL import Image
+from sklearn.cluster import KMeans
+from sklearn.decomposition import IncrementalPCA
+from GCodeGenerator.color_quantization_kmeans import stratified_pixel_sample
+from GCodeGenerator.palette import Palette, preset_colors
+from GCodeGenerator.palette_mapping import (
+    map_image_through_centroids,
+    nearest_color_indices,
+)
+
+# Channels of the raw pixel layouts that can be mapped directly, as slices giving RGB order
+raw_image_channels = {
+    "RGB": slice(0, 3),
+    "RGBX": slice(0, 3),
+    "BGR": slice(2, None, -1),
+    "BGRX": slice(2, None, -1),
+}
+
+
+def raw_image_memmap(input_image_path):
+    """
+    Maps the pixels of an uncompressed image file, such as a PPM, a 24 or 32-bit BMP, a TGA or
+    an uncompressed TIFF stored in one strip, without decoding it.
+
+    Pillow only reads the header when it opens a file, and its tile list tells where the pixel
+    rows are stored and in which layout.
+
+    Parameters:
+    - input_image_path: Path to the input image.
+
+    Returns:
+    - A read-only RGB (height, width, 3) view of the file, or None if the pixels are compressed,
+      split in several tiles or in a layout other than raw_image_channels.
+    """
+    try:
+        with Image.open(input_image_path) as pil_image:
+            tiles = pil_image.tile
+            width, height = pil_image.size
+    except OSError:
+        return None
+    if len(tiles) != 1:
+        return None
+    codec_name, extents, offset, args = tiles[0]
+    if codec_name != "raw" or tuple(extents) != (0, 0, width, height):
+        return None
+    # The raw decoder takes a bare mode or a (mode, stride, orientation) tuple
+    rawmode, stride, orientation = (args, 0, 1) if isinstance(args, str) else args
+    if rawmode not in raw_image_channels:
+        return None
+
+    pixel_size = len(rawmode)
+    stride = stride or width * pixel_size
+    rows = np.memmap(
+        input_image_path,
+        dtype=np.uint8,
+        mode="r",
+        offset=offset,
+        shape=(height, stride),
+    )
+    pixels = np.lib.stride_tricks.as_strided(
+        rows,
+        shape=(height, width, pixel_size),
+        strides=(stride, pixel_size, 1),
+        writeable=False,
+    )
+    if orientation < 0:
+        # Bottom-up rows, as in BMP and TGA files
+        pixels = pixels[::-1]
+    return pixels[..., raw_image_channels[rawmode]]
+
+
+def open_image_memmap(input_image_path, scratch_folder, strip_rows=256):
+    """
+    Opens an image as a memory-mapped RGB array.
+
+    A .npy file holding an RGB (height, width, 3) uint8 array, or an uncompressed image file
+    (see raw_image_memmap), is mapped directly. Any other image is decoded once and copied strip
+    by strip into a scratch .npy file, so the rest of the tiled pipeline reads it through the
+    page cache instead of holding it in memory.
+
+    Parameters:
+    - input_image_path: Path to the input image or .npy file.
+    - scratch_folder: Folder where the scratch copy of a decoded image is written.
+    - strip_rows: The number of rows copied at once.
+
+    Returns:
+    - A read-only memory-mapped RGB array.
+    """
+    if input_image_path.lower().endswith(".npy"):
+        return np.load(input_image_path, mmap_mode="r")
+
+    image = raw_image_memmap(input_image_path)
+    if image is not None:
+        return image
+
+    decoded = cv2.imread(input_image_path)
+    if decoded is None:
+        raise ValueError("Could not read the image.")
+
+    scratch_path = os.path.join(scratch_folder, "input.npy")
+    image = np.lib.format.open_memmap(
+        scratch_path, mode="w+", dtype=np.uint8, shape=decoded.shape
+    )
+    for start in range(0, decoded.shape[0], strip_rows):
+        image[start : start + strip_rows] = cv2.cvtColor(
+            decoded[start : start + strip_rows], cv2.COLOR_BGR2RGB
+        )
+    image.flush()
+    del decoded, image
+    return np.load(scratch_path, mmap_mode="r")
+
+
+def tiled_color_quantization(
+    input_image_path,
+    output_image_path,
+    preset_colors,
+    method="kmeans",
+    strip_rows=256,
+    num_clusters=18,
+    sample_size=200000,
+    num_components=3,
+    random_state=None,
+    scratch_folder=None,
+):
+    """
+    Quantizes an image of any size strip by strip, without downscaling it.
+
+    The color model is fitted once for the whole image, so all strips share the same colors
+    and no seams appear between them: K-means is fitted on a stratified sample drawn from
+    every strip, PCA is fitted with IncrementalPCA over all strips. Each strip is then mapped
+    to the preset colors and written into a memory-mapped output.
+
+    Parameters:
+    - input_image_path: Path to the input image, or to a .npy RGB array that is memory-mapped.
+      Uncompressed image files are memory-mapped too, see raw_image_memmap.
+    - output_image_path: Path of the result. A .npy path receives the RGB array directly,
+      any other path is written as an image file once all strips are done.
+    - preset_colors: Array of RGB values representing the preset colors.
+    - method: "kmeans", "PCA" or "nearest" (plain palette mapping without fitting).
+    - strip_rows: The number of image rows processed at once.
+    - num_clusters: The number of clusters to use for K-means clustering.
+    - sample_size: The total number of pixels sampled over all strips to fit K-means.
+    - num_components: Number of principal components to keep for PCA.
+    - random_state: Seed used for sampling and centroid initialization.
+    - scratch_folder: Folder for temporary memory-mapped files, a new temporary folder if None.
+    """
+    if method not in ("kmeans", "PCA", "nearest"):
+        raise ValueError(f"Unknown method '{method}'.")
+
+    own_scratch_folder = scratch_folder is None
+    if own_scratch_folder:
+        scratch_folder = tempfile.mkdtemp()
+
+    try:
+        image = open_image_memmap(input_image_path, scratch_folder, strip_rows)
+        height, width = image.shape[:2]
+        strips = range(0, height, strip_rows)
+
+        def read_strip(start):
+            return np.asarray(image[start : start + strip_rows])
+
+        # Fit the color model once over the whole image
+        if method == "kmeans":
+            rng = np.random.default_rng(random_state)
+            samples = []
+            for start in strips:
+                strip = read_strip(start).reshape((-1, 3))
+                strip_sample_size = max(
+                    1, round(sample_size * strip.shape[0] / (height * width))
+                )
+                samples.append(stratified_pixel_sample(strip, strip_sample_size, rng))
+            samples = np.concatenate(samples)
+            kmeans = KMeans(
+                n_clusters=min(num_clusters, len(samples)), random_state=random_state
+            )
+            kmeans.fit(samples)
+            centroids = kmeans.cluster_centers_.astype(int)
+            mapped_colors = np.asarray(preset_colors)[
+                nearest_color_indices(centroids, preset_colors)
+            ]
+        elif method == "PCA":
+            pca = IncrementalPCA(n_components=num_components)
+            for start in strips:
+                strip = read_strip(start).reshape((-1, 3)).astype(np.float32)
+                if strip.shape[0] >= num_components:
+                    pca.partial_fit(strip)
+        palette = Palette(preset_colors)
+
+        if output_image_path.lower().endswith(".npy"):
+            output_array_path = output_image_path
+        else:
+            output_array_path = os.path.join(scratch_folder, "output.npy")
+        # An image file is encoded from BGR, so its strips are stored in that order
+        bgr_output = output_array_path != output_image_path
+        output = np.lib.format.open_memmap(
+            output_array_path, mode="w+", dtype=np.uint8, shape=(height, width, 3)
+        )
+
+        # Map and write one strip at a time
+        for start in strips:
+            strip = read_strip(start)
+            if method == "kmeans":
+                quantized_strip = map_image_through_centroids(
+                    strip, centroids, mapped_colors
+                )
+            elif method == "PCA":
+                pixels = strip.reshape((-1, 3)).astype(np.float32)
+                reconstructed = pca.inverse_transform(pca.transform(pixels))
+                np.clip(reconstructed, 0, 255, out=reconstructed)
+                quantized_strip = palette.apply(
+                    reconstructed.astype(np.uint8).reshape(strip.shape)
+                )
+            else:
+                quantized_strip = palette.apply(strip)
+            if bgr_output:
+                quantized_strip = quantized_strip[..., ::-1]
+            output[start : start + strip_rows] = quantized_strip
+        output.flush()
+
+        if bgr_output:
+            # Image encoders need the whole array; it is read through the memory map, uncopied
+            cv2.imwrite(output_image_path, output)
+        del output, image
+    finally:
+        if own_scratch_folder:
+            shutil.rmtree(scratch_folder, ignore_errors=True)
+
+
+# # Example usage
+# if __name__ == "__main__":
+#     input_image_path = "MAIN BRAINTER/GCodeGenerator/Assets/Images/brainter.png"
+#     output_image_path = "MAIN BRAINTER/GCodeGenerator/Assets/Quantized Images/brainter_tiled.png"
+#     tiled_color_quantization(input_image_path, output_image_path, preset_colors)
@@ -1,134 +1,1249 @@
 from PIL import Image
-import svgwrite
 import numpy as np
 import cv2
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from GCodeGenerator.svg_writer import write_svg_stream
+from GCodeGenerator.packed_masks import PackedMask, load_packed_masks
+from GCodeGenerator.centerline_tracing import (
+    centerline_strokes,
+    split_thin_components,
+)
 
 
-def vectorization(input_folder, output_folder, line_spacing=1, line_thickness=1):
+def collinear_lines(points, line_spacing=1):
     """
-    Process all images in the specified input folder, converting them to SVG format with dense lines
-    within shape fills using contour detection, and save the results in the output folder.
+    Joins the points of one hatch row into lines.
+
+    Points whose x-values are within 2 * line_spacing of the next point are drawn as one line.
 
     Parameters:
-    - input_folder: Path to the folder containing the input images.
-    - output_folder: Path to the folder where the SVG files will be saved.
+    - points: The (x, y) points of one row inside a shape, sorted by x.
     - line_spacing: The spacing between lines used to fill the shapes.
-    - line_thickness: The thickness of the lines used to fill the shapes.
+
+    Returns:
+    - A list of (start_point, end_point) lines.
+    """
+    lines = []
+    if not points:
+        return lines
+
+    # Start with the first point as the starting point of a line
+    start_point = points[0]
+    for i in range(1, len(points)):
+        current_point = points[i]
+        next_point = points[i + 1] if i + 1 < len(points) else None
+
+        # Check if the current point and the next point are collinear (i.e., have the same y-value)
+        # and are close enough (i.e., their x-values are within 2 * line_spacing).
+        # If they are not, or if there is no next point, draw the line from start_point to current_point
+        # and update start_point to be the next point.
+        if (
+            not next_point
+            or np.abs(current_point[0] - next_point[0]) > 2 * line_spacing
+        ):
+            end_point = current_point
+            lines.append((start_point, end_point))
+            start_point = next_point if next_point else None
+    return lines
+
+
+def contour_hatch_lines(img, line_spacing=1):
+    """
+    Fills the shapes of a grayscale mask with horizontal lines using contour detection.
+
+    Every pixel in the bounding box of each shape is tested against its contour and its own
+    holes with cv2.pointPolygonTest. scanline_hatch_lines gives the same lines much faster.
+
+    Parameters:
+    - img: The grayscale mask, shapes are pixels above 127.
+    - line_spacing: The spacing between lines used to fill the shapes.
+
+    Returns:
+    - A list of (start_point, end_point) lines in pixel coordinates.
+    """
+    _, thresh = cv2.threshold(
+        img, 127, 255, cv2.THRESH_BINARY
+    )  # Use normal thresholding
+    contours, hierarchy = cv2.findContours(
+        thresh, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE
+    )
+    lines = []
+    if not contours:
+        return lines
+
+    # Function to check if a point is inside one of the holes of a shape. The holes are
+    # given with their bounding boxes, which rule most of them out before the exact test.
+    def is_inside_hole(point, holes):
+        for (x, y, w, h), hole in holes:
+            if x <= point[0] < x + w and y <= point[1] < y + h:
+                if cv2.pointPolygonTest(hole, point, False) > 0:
+                    return True
+        return False
+
+    # Containment index: the RETR_CCOMP hierarchy gives each external contour its own holes.
+    # A shape lying inside the hole of another one is an external contour of its own, so it
+    # is filled and only tested against its own holes.
+    external_holes = {i: [] for i in range(len(contours)) if hierarchy[0][i][3] == -1}
+    for i, contour in enumerate(contours):
+        parent = hierarchy[0][i][3]
+        if parent != -1:
+            external_holes[parent].append((cv2.boundingRect(contour), contour))
+
+    for i, holes in external_holes.items():
+        contour = contours[i]
+        x, y, w, h = cv2.boundingRect(contour)
+        for line_y in range(y, y + h, line_spacing):
+            row_holes = [
+                hole for hole in holes if hole[0][1] <= line_y < hole[0][1] + hole[0][3]
+            ]
+            points_inside_contour = []
+            for line_x in range(x, x + w, 1):
+                if cv2.pointPolygonTest(contour, (line_x, line_y), False) >= 0:
+                    if not is_inside_hole((line_x, line_y), row_holes):
+                        points_inside_contour.append((line_x, line_y))
+
+            lines += collinear_lines(points_inside_contour, line_spacing)
+    return lines
+
+
+def mask_runs(thresh):
+    """
+    Finds the runs of pixels of every row of a binary mask.
+
+    Parameters:
+    - thresh: The binary mask, non-zero inside the shapes.
+
+    Returns:
+    - A tuple (rows, starts, ends) of arrays holding the row, first and last column of every
+      run, in raster order.
+    """
+    padded = np.pad(thresh > 0, ((0, 0), (1, 1))).astype(np.int8)
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    return rows, starts, ends - 1
+
+
+def label_band(thresh, first_row=0):
+    """
+    Labels the 8-connected shapes of a band of rows of a binary mask for the scanline hatching.
+
+    The shapes are numbered in the order of their first pixel in raster order, so labeling the
+    same band twice always gives the same numbers.
+
+    Parameters:
+    - thresh: The rows of the binary mask, 255 inside the shapes.
+    - first_row: The row of the full mask the band starts at.
+
+    Returns:
+    - A tuple (runs, run_shapes, first_pixels, shape_tops, edge_shapes): the runs of the band
+      (see mask_runs, in full mask rows) and the number of the shape of each run, for every
+      shape the raster position of its first pixel (row * width + column, in full mask rows)
+      and the top row of its bounding box, and the shape numbers of the first and last rows
+      of the band, -1 outside the shapes.
+    """
+    num_shapes, shape_labels, stats, _ = cv2.connectedComponentsWithStats(
+        thresh, connectivity=8
+    )
+    rows, starts, ends = mask_runs(thresh)
+    run_labels = shape_labels[rows, starts]
+    rows += first_row
+
+    # The runs are in raster order, so the first run of a shape starts at its first pixel
+    first_pixels = np.full(num_shapes, np.iinfo(np.int64).max)
+    np.minimum.at(first_pixels, run_labels, rows * thresh.shape[1] + starts)
+    order = np.argsort(first_pixels[1:])
+    shape_numbers = np.full(num_shapes, -1, dtype=np.int64)
+    shape_numbers[order + 1] = np.arange(num_shapes - 1)
+    return (
+        (rows, starts, ends),
+        shape_numbers[run_labels],
+        first_pixels[1:][order],
+        stats[1:, cv2.CC_STAT_TOP][order] + first_row,
+        (shape_numbers[shape_labels[0]], shape_numbers[shape_labels[-1]]),
+    )
+
+
+def join_hatch_runs(runs, run_ranks, run_tops, line_spacing=1):
+    """
+    Joins runs of pixels into hatch lines, see scanline_hatch_segments.
+
+    A line never spans two rows, so the bands of a mask can be joined independently and
+    their lines put back in order with their shape ranks.
+
+    Parameters:
+    - runs: The (rows, starts, ends) arrays of the runs, see mask_runs.
+    - run_ranks: The rank of the shape of each run, which also tells the shapes apart.
+    - run_tops: The top row of the shape of each run.
+    - line_spacing: The spacing between lines used to fill the shapes.
+
+    Returns:
+    - An integer array of shape (N, 5) holding the x1, y1, x2, y2 of each line followed by
+      the rank of its shape, sorted by rank, row and x1.
+    """
+    rows, starts, ends = runs
+    kept = (rows - run_tops) % line_spacing == 0
+    rows, starts, ends, run_ranks = (
+        rows[kept],
+        starts[kept],
+        ends[kept],
+        run_ranks[kept],
+    )
+    order = np.lexsort((starts, rows, run_ranks))
+    rows, starts, ends, run_ranks = (
+        rows[order],
+        starts[order],
+        ends[order],
+        run_ranks[order],
+    )
+    if rows.size == 0:
+        return np.empty((0, 5), dtype=np.int64)
+
+    # Split the runs into rows of one shape, then into lines
+    new_row = np.ones(rows.size, dtype=bool)
+    new_row[1:] = (rows[1:] != rows[:-1]) | (run_ranks[1:] != run_ranks[:-1])
+    single_pixel_first_run = new_row[:-1] & (starts[:-1] == ends[:-1])
+    new_line = new_row.copy()
+    new_line[1:] |= (starts[1:] - ends[:-1] > 2 * line_spacing) & (
+        ~single_pixel_first_run
+    )
+    line_starts = np.flatnonzero(new_line)
+    line_ends = np.append(line_starts[1:], rows.size) - 1
+    # A row of a single pixel gives no line
+    row_ends = np.append(new_row[1:], True)
+    lone_pixel = new_row & row_ends & (starts == ends)
+    drawn = ~lone_pixel[line_starts]
+    line_starts, line_ends = line_starts[drawn], line_ends[drawn]
+    return np.stack(
+        (
+            starts[line_starts],
+            rows[line_starts],
+            ends[line_ends],
+            rows[line_ends],
+            run_ranks[line_starts],
+        ),
+        axis=1,
+    ).astype(np.int64)
+
+
+def scanline_hatch_segments(img, line_spacing=1):
+    """
+    Fills the shapes of a grayscale mask with horizontal lines by scanning runs of pixels.
+
+    The lines are the same, in the same order, as the ones of contour_hatch_lines, but they
+    are found from the runs of each row with vectorized diffs instead of testing every pixel
+    against the contours, so the cost is linear in the size of the mask:
+    - every 8-connected shape is filled from the top of its bounding box, one row every
+      line_spacing rows, in the order of the external contours of cv2.findContours, which
+      lists the shapes from the last one to start in raster order to the first;
+    - shapes lying inside the hole of another shape are filled like the others;
+    - the runs of a row are joined when the gap between them is at most 2 * line_spacing,
+      with the same exceptions as collinear_lines (the gap after a single-pixel first run is
+      always joined, and a row holding a single pixel gives no line).
+
+    Parameters:
+    - img: The grayscale mask, shapes are pixels above 127.
+    - line_spacing: The spacing between lines used to fill the shapes.
+
+    Returns:
+    - An integer array of shape (N, 4) holding the x1, y1, x2, y2 of each line.
+    """
+    _, thresh = cv2.threshold(img, 127, 255, cv2.THRESH_BINARY)
+    runs, run_shapes, first_pixels, shape_tops, _ = label_band(thresh)
+    shape_ranks = len(first_pixels) - 1 - np.arange(len(first_pixels))
+    return join_hatch_runs(
+        runs, shape_ranks[run_shapes], shape_tops[run_shapes], line_spacing
+    )[:, :4]
+
+
+def band_shape_summary(band):
+    """
+    Labels the shapes of one band of a mask, for band_parallel_hatch_segments.
+
+    Parameters:
+    - band: A PackedMask holding rows of the thresholded mask, see PackedMask.band.
+
+    Returns:
+    - A tuple (first_pixels, shape_tops, top_shapes, bottom_shapes), see label_band.
+    """
+    _, _, first_pixels, shape_tops, edge_shapes = label_band(band.rows(), band.bbox[1])
+    return (first_pixels, shape_tops, *edge_shapes)
+
+
+def merge_band_shapes(summaries):
+    """
+    Joins the shapes of neighbouring bands that touch across their common edge, and ranks the
+    shapes of the whole mask like scanline_hatch_segments.
+
+    Parameters:
+    - summaries: The band_shape_summary of every band, from top to bottom.
+
+    Returns:
+    - A list holding, for every band, the (shape_ranks, shape_tops) arrays of the whole mask
+      indexed by the shape numbers of the band.
+    """
+    offsets = np.cumsum([0] + [len(summary[0]) for summary in summaries])
+    first_pixels = np.concatenate([summary[0] for summary in summaries])
+    shape_tops = np.concatenate([summary[1] for summary in summaries])
+
+    # Pairs of shapes touching across a band edge, with 8-connectivity
+    pairs = [np.empty((0, 2), dtype=np.int64)]
+    for index, (upper, lower) in enumerate(zip(summaries[:-1], summaries[1:])):
+        bottom_shapes, top_shapes = upper[3], lower[2]
+        width = len(bottom_shapes)
+        for shift in (-1, 0, 1):
+            above = bottom_shapes[max(0, -shift) : width - max(0, shift)]
+            below = top_shapes[max(0, shift) : width - max(0, -shift)]
+            touching = (above >= 0) & (below >= 0)
+            pairs.append(
+                np.stack(
+                    (
+                        above[touching] + offsets[index],
+                        below[touching] + offsets[index + 1],
+                    ),
+                    axis=1,
+                )
+            )
+
+    # Union-find over the pairs, every shape pointing to the first shape of its group
+    parents = np.arange(offsets[-1])
+
+    def root(shape):
+        while parents[shape] != shape:
+            parents[shape] = parents[parents[shape]]
+            shape = parents[shape]
+        return shape
+
+    for first, second in np.unique(np.concatenate(pairs), axis=0).tolist():
+        first, second = root(first), root(second)
+        if first != second:
+            parents[max(first, second)] = min(first, second)
+    while True:
+        grandparents = parents[parents]
+        if np.array_equal(grandparents, parents):
+            break
+        parents = grandparents
+
+    # A shape starts at the first pixel of its group and its bounding box at the top one
+    group_first_pixels = np.full(offsets[-1], np.iinfo(np.int64).max)
+    np.minimum.at(group_first_pixels, parents, first_pixels)
+    group_tops = np.full(offsets[-1], np.iinfo(np.int64).max)
+    np.minimum.at(group_tops, parents, shape_tops)
+    groups = np.flatnonzero(parents == np.arange(offsets[-1]))
+    group_ranks = np.zeros(offsets[-1], dtype=np.int64)
+    group_ranks[groups[np.argsort(-group_first_pixels[groups])]] = np.arange(
+        groups.size
+    )
+    shape_ranks, shape_tops = group_ranks[parents], group_tops[parents]
+    return [
+        (shape_ranks[start:stop], shape_tops[start:stop])
+        for start, stop in zip(offsets[:-1], offsets[1:])
+    ]
+
+
+def band_hatch_segments(band, shape_ranks, shape_tops, line_spacing=1):
+    """
+    Hatches one band of a mask, for band_parallel_hatch_segments.
+
+    Parameters:
+    - band: A PackedMask holding rows of the thresholded mask, see PackedMask.band.
+    - shape_ranks: The rank of every shape of the band in the whole mask.
+    - shape_tops: The top row of every shape of the band in the whole mask.
+    - line_spacing: The spacing between lines used to fill the shapes.
+
+    Returns:
+    - An integer array of shape (N, 5), see join_hatch_runs.
+    """
+    runs, run_shapes, _, _, _ = label_band(band.rows(), band.bbox[1])
+    return join_hatch_runs(
+        runs, shape_ranks[run_shapes], shape_tops[run_shapes], line_spacing
+    )
+
+
+def band_parallel_hatch_segments(
+    img, line_spacing=1, max_workers=None, num_bands=None, executor=None
+):
+    """
+    Hatches one mask like scanline_hatch_segments, with its rows split across worker processes.
+
+    The workers go over the bands twice. First they label the shapes of each band, then the
+    shapes touching across band edges are joined from the first and last rows of the bands
+    and the shapes of the whole mask are ranked, which is cheap. Then the workers hatch each
+    band with these ranks, and the lines of all bands are sorted back into the order of
+    scanline_hatch_segments. The bands are sent to the workers bit-packed, see packed_masks.
+    This speeds up a single large layer, which per-layer parallelism cannot split.
+
+    Parameters:
+    - img: The grayscale mask, shapes are pixels above 127.
+    - line_spacing: The spacing between lines used to fill the shapes.
+    - max_workers: The number of worker processes, None for one per CPU, 1 to hatch the
+      bands in this process.
+    - num_bands: The number of horizontal bands, twice the number of workers if None.
+    - executor: A running ProcessPoolExecutor to use instead of starting one, so that
+      several masks can share the same workers.
+
+    Returns:
+    - An integer array of shape (N, 4) holding the x1, y1, x2, y2 of each line.
     """
+    _, thresh = cv2.threshold(img, 127, 255, cv2.THRESH_BINARY)
+    if not thresh.any():
+        return np.empty((0, 4), dtype=np.int64)
+    if num_bands is None:
+        num_bands = 2 * (max_workers or os.cpu_count() or 1)
+    band_edges = np.unique(np.linspace(0, thresh.shape[0], num_bands + 1).astype(int))
+    packed_mask = PackedMask.from_cropped(
+        thresh, (0, 0, thresh.shape[1], thresh.shape[0]), thresh.shape
+    )
+    bands = [
+        packed_mask.band(top, bottom)
+        for top, bottom in zip(band_edges[:-1], band_edges[1:])
+    ]
 
-    def draw_collinear_lines(dwg, points, line_spacing, line_thickness):
-        if not points:
-            return
-
-        # Start with the first point as the starting point of a line
-        start_point = points[0]
-        for i in range(1, len(points)):
-            current_point = points[i]
-            next_point = points[i + 1] if i + 1 < len(points) else None
-
-            # Check if the current point and the next point are collinear (i.e., have the same y-value)
-            # and are close enough (i.e., their x-values are within 2 * line_spacing).
-            # If they are not, or if there is no next point, draw the line from start_point to current_point
-            # and update start_point to be the next point.
-            if (
-                not next_point
-                or np.abs(current_point[0] - next_point[0]) > 2 * line_spacing
-            ):
-                end_point = current_point
-                dwg.add(
-                    dwg.line(
-                        start=start_point,
-                        end=end_point,
-                        stroke="white",
-                        stroke_width=line_thickness,
-                    )
+    if executor is None and max_workers != 1:
+        pool = ProcessPoolExecutor(max_workers=max_workers)
+    else:
+        pool = nullcontext(executor)
+    with pool as executor:
+        run = map if executor is None else executor.map
+        band_shapes = merge_band_shapes(list(run(band_shape_summary, bands)))
+        shape_ranks, shape_tops = zip(*band_shapes)
+        segments = np.concatenate(
+            list(
+                run(
+                    band_hatch_segments,
+                    bands,
+                    shape_ranks,
+                    shape_tops,
+                    [line_spacing] * len(bands),
                 )
-                start_point = next_point if next_point else None
-
-    def process_image(image_path, svg_path, line_spacing=1, line_thickness=1):
-        img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-        _, thresh = cv2.threshold(
-            img, 127, 255, cv2.THRESH_BINARY
-        )  # Use normal thresholding
-        contours, hierarchy = cv2.findContours(
-            thresh, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE
+            )
         )
+    order = np.lexsort((segments[:, 0], segments[:, 1], segments[:, 4]))
+    return segments[order, :4]
 
-        height, width = img.shape[:2]
-        dwg = svgwrite.Drawing(svg_path, profile="tiny", size=(width, height))
-        dwg.add(dwg.rect(insert=(0, 0), size=(width, height), fill="black"))
 
-        # Function to check if a point is inside any internal contour
-        def is_inside_internal_contour(point, internal_contours):
-            for ic in internal_contours:
-                if cv2.pointPolygonTest(ic, point, False) > 0:
-                    return True
-            return False
-
-        # Function to draw collinear lines
-        def draw_collinear_lines(dwg, points, line_spacing, line_thickness):
-            if not points:
-                return
-
-            start_point = points[0]
-            for i in range(1, len(points)):
-                current_point = points[i]
-                next_point = points[i + 1] if i + 1 < len(points) else None
-
-                if (
-                    not next_point
-                    or np.abs(current_point[0] - next_point[0]) > 2 * line_spacing
-                ):
-                    end_point = current_point
-                    dwg.add(
-                        dwg.line(
-                            start=start_point,
-                            end=end_point,
-                            stroke="white",
-                            stroke_width=line_thickness,
-                        )
-                    )
-                    start_point = next_point if next_point else None
-
-        # Organize contours into external and internal based on hierarchy
-        external_contours = [
-            contour for i, contour in enumerate(contours) if hierarchy[0][i][3] == -1
-        ]
-        internal_contours = [
-            contour for i, contour in enumerate(contours) if hierarchy[0][i][3] != -1
+def scanline_hatch_lines(img, line_spacing=1):
+    """
+    Fills the shapes of a grayscale mask with horizontal lines, see scanline_hatch_segments.
+
+    Parameters:
+    - img: The grayscale mask, shapes are pixels above 127.
+    - line_spacing: The spacing between lines used to fill the shapes.
+
+    Returns:
+    - A list of (start_point, end_point) lines in pixel coordinates.
+    """
+    return [
+        ((x1, y1), (x2, y2))
+        for x1, y1, x2, y2 in scanline_hatch_segments(img, line_spacing).tolist()
+    ]
+
+
+def band_parallel_hatch_lines(img, line_spacing=1, **options):
+    """
+    Fills the shapes of a grayscale mask with horizontal lines, see band_parallel_hatch_segments.
+
+    Parameters:
+    - img: The grayscale mask, shapes are pixels above 127.
+    - line_spacing: The spacing between lines used to fill the shapes.
+    - **options: max_workers, num_bands and executor, see band_parallel_hatch_segments.
+
+    Returns:
+    - A list of (start_point, end_point) lines in pixel coordinates.
+    """
+    return [
+        ((x1, y1), (x2, y2))
+        for x1, y1, x2, y2 in band_parallel_hatch_segments(
+            img, line_spacing, **options
+        ).tolist()
+    ]
+
+
+# Hatch fill engines by name, all returning the same lines
+hatch_engines = {
+    "scanline": scanline_hatch_lines,
+    "bands": band_parallel_hatch_lines,
+    "contour": contour_hatch_lines,
+}
+
+
+def hatch_lines(img, line_spacing=1, hatch_engine="scanline", hatch_options=None):
+    """
+    Fills the shapes of a grayscale mask with horizontal lines.
+
+    Parameters:
+    - img: The grayscale mask, shapes are pixels above 127.
+    - line_spacing: The spacing between lines used to fill the shapes.
+    - hatch_engine: "scanline" (run-length, linear in the image size), "bands" (the scanline
+      engine with the rows split across one worker process per CPU, for a single large layer)
+      or "contour" (the original per-pixel contour tests).
+    - hatch_options: Extra arguments of the engine, such as max_workers, num_bands and
+      executor for "bands" (see band_parallel_hatch_segments).
+
+    Returns:
+    - A list of (start_point, end_point) lines in pixel coordinates.
+    """
+    if hatch_engine not in hatch_engines:
+        raise ValueError(
+            f"Unknown hatch engine '{hatch_engine}'. Available: {', '.join(hatch_engines)}."
+        )
+    return hatch_engines[hatch_engine](img, line_spacing, **(hatch_options or {}))
+
+
+def estimate_stroke_count(mask, line_spacing=1):
+    """
+    Estimates how many lines the hatch fill of a mask produces, without tracing its contours.
+
+    Every line_spacing-th row is split into runs of pixels, and runs closer than 2 * line_spacing
+    are joined, the way collinear_lines joins points. Every line costs one pen lift.
+
+    Parameters:
+    - mask: A 2D mask where non-zero pixels are filled.
+    - line_spacing: The spacing between lines used to fill the shapes.
+
+    Returns:
+    - The estimated number of lines.
+    """
+    rows = np.asarray(mask)[::line_spacing] > 0
+    if not rows.any():
+        return 0
+    padded = np.pad(rows, ((0, 0), (1, 1))).astype(np.int8)
+    edges = np.diff(padded, axis=1)
+    start_rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    # A run starts a new line on a new row or after a gap wider than 2 * line_spacing
+    new_line = (start_rows[1:] != start_rows[:-1]) | (
+        starts[1:] - (ends[:-1] - 1) > 2 * line_spacing
+    )
+    return 1 + int(np.count_nonzero(new_line))
+
+
+# Hatch angles compared by the "auto" hatch angle, in degrees
+hatch_candidate_angles = (0, 45, 90, 135)
+
+
+def toolpath_stats(lines, feed_rate=1000, pen_lift_time=0.5):
+    """
+    Measures the strokes of a toolpath drawn in the given order.
+
+    Parameters:
+    - lines: A list of strokes, each a sequence of (x, y) points in millimeters.
+    - feed_rate: The drawing and travel speed in millimeters per minute.
+    - pen_lift_time: The time in seconds to lift and lower the pen for each stroke.
+
+    Returns:
+    - A dictionary with the number of "strokes", the pen-down "drawing" distance, the
+      pen-up "travel" distance between strokes and the estimated "plot_time" in seconds.
+    """
+    drawing, travel = 0.0, 0.0
+    previous_end = None
+    for stroke in lines:
+        points = np.asarray(stroke, dtype=np.float64)
+        drawing += np.hypot(*np.diff(points, axis=0).T).sum()
+        if previous_end is not None:
+            travel += np.hypot(*(points[0] - previous_end))
+        previous_end = points[-1]
+    return {
+        "strokes": len(lines),
+        "drawing": float(drawing),
+        "travel": float(travel),
+        "plot_time": float(
+            (drawing + travel) / (feed_rate / 60) + len(lines) * pen_lift_time
+        ),
+    }
+
+
+def estimate_plot_time(lines, feed_rate=1000, pen_lift_time=0.5):
+    """
+    Estimates how long the plotter takes to draw strokes in the given order.
+
+    Parameters:
+    - lines: A list of strokes, each a sequence of (x, y) points in millimeters.
+    - feed_rate: The drawing and travel speed in millimeters per minute.
+    - pen_lift_time: The time in seconds to lift and lower the pen for each stroke.
+
+    Returns:
+    - The estimated time in seconds.
+    """
+    return toolpath_stats(lines, feed_rate, pen_lift_time)["plot_time"]
+
+
+def sample_rotated_mask(img, rotation, grid_offset, grid_size, origin=(0, 0)):
+    """
+    Samples a mask on a rotated pixel grid, taking the nearest pixel of every grid pixel.
+
+    The position of every grid pixel is rotated back and rounded in full image coordinates,
+    so the pixel it samples only depends on its position in the full image, not on where img
+    is cropped. cv2.warpAffine rounds its sample positions in fixed point relative to the
+    crop, which makes a crop sample other pixels than the full mask at most angles.
+
+    Parameters:
+    - img: The grayscale mask.
+    - rotation: The 2x2 rotation matrix taking full image coordinates to the rotated grid.
+    - grid_offset: The (x, y) rotated coordinates of the first pixel of the grid.
+    - grid_size: The (width, height) of the grid.
+    - origin: The (x, y) position of img inside the full image.
+
+    Returns:
+    - The rotated mask, of the size of the grid, 0 where the grid leaves img.
+    """
+    grid_width, grid_height = grid_size
+    rotated = np.empty((grid_height, grid_width), dtype=img.dtype)
+    grid_x = np.arange(grid_width) + grid_offset[0]
+    # A block of rows at a time keeps the coordinate arrays small
+    block_rows = max(1, (1 << 20) // max(grid_width, 1))
+    for top in range(0, grid_height, block_rows):
+        grid_y = np.arange(top, min(top + block_rows, grid_height))[:, None]
+        grid_y = grid_y + grid_offset[1]
+        source_x = np.rint(grid_x * rotation[0, 0] + grid_y * rotation[1, 0])
+        source_y = np.rint(grid_x * rotation[0, 1] + grid_y * rotation[1, 1])
+        # The maps hold whole pixel positions, which cv2.remap takes as they are
+        rotated[top : top + grid_y.shape[0]] = cv2.remap(
+            img,
+            (source_x - origin[0]).astype(np.float32),
+            (source_y - origin[1]).astype(np.float32),
+            cv2.INTER_NEAREST,
+            borderMode=cv2.BORDER_CONSTANT,
+            borderValue=0,
+        )
+    return rotated
+
+
+def rotated_hatch_lines(
+    img,
+    hatch_angle,
+    line_spacing=1,
+    hatch_engine="scanline",
+    origin=(0, 0),
+    hatch_options=None,
+):
+    """
+    Fills the shapes of a grayscale mask with parallel lines at any angle.
+
+    The mask is rotated so the lines become horizontal, filled with hatch_lines, and the line
+    ends are rotated back. The rotation is done around the origin of the full image and
+    every rotated pixel samples the mask from its full image position (see
+    sample_rotated_mask), so a crop of a mask holding all of its shapes gets the same lines
+    as the full mask.
+
+    Parameters:
+    - img: The grayscale mask, shapes are pixels above 127.
+    - hatch_angle: The angle of the lines in degrees, counter-clockwise from horizontal.
+    - line_spacing: The spacing between lines used to fill the shapes.
+    - hatch_engine: The hatch fill engine, see hatch_lines.
+    - origin: The (x, y) position of img inside the full image.
+    - hatch_options: Extra arguments of the hatch fill engine, see hatch_lines.
+
+    Returns:
+    - A list of (start_point, end_point) lines in full image coordinates. Horizontal lines
+      have integer coordinates, other angles coordinates rounded to 0.01.
+    """
+    origin_x, origin_y = origin
+    if hatch_angle % 180 == 0:
+        return [
+            ((x1 + origin_x, y1 + origin_y), (x2 + origin_x, y2 + origin_y))
+            for (x1, y1), (x2, y2) in hatch_lines(
+                img, line_spacing, hatch_engine, hatch_options
+            )
         ]
 
-        for contour in external_contours:
-            x, y, w, h = cv2.boundingRect(contour)
-            for line_y in range(y, y + h, line_spacing):
-                points_inside_contour = []
-                for line_x in range(x, x + w, 1):
-                    if cv2.pointPolygonTest(contour, (line_x, line_y), False) >= 0:
-                        if not is_inside_internal_contour(
-                            (line_x, line_y), internal_contours
-                        ):
-                            points_inside_contour.append((line_x, line_y))
-
-                draw_collinear_lines(
-                    dwg, points_inside_contour, line_spacing, line_thickness
-                )
+    # Rotation taking the direction of the lines to the x axis (image y axis points down)
+    radians = np.deg2rad(hatch_angle)
+    cos, sin = np.cos(radians), np.sin(radians)
+    rotation = np.array([[cos, -sin], [sin, cos]])
+
+    # Place the rotated mask on the integer grid of the rotated full image
+    height, width = img.shape[:2]
+    corners = np.array(
+        [[0, 0], [width - 1, 0], [0, height - 1], [width - 1, height - 1]]
+    ) + np.array(origin)
+    rotated_corners = corners @ rotation.T
+    grid_offset = np.floor(rotated_corners.min(axis=0))
+    rotated_width, rotated_height = (
+        np.ceil(rotated_corners.max(axis=0)) - grid_offset + 1
+    ).astype(int)
+    rotated = sample_rotated_mask(
+        img, rotation, grid_offset, (int(rotated_width), int(rotated_height)), origin
+    )
+
+    lines = hatch_lines(rotated, line_spacing, hatch_engine, hatch_options)
+    if not lines:
+        return []
+    points = (
+        np.asarray(lines, dtype=np.float64).reshape((-1, 2)) + grid_offset
+    ) @ rotation
+    # Adding 0.0 turns the -0.0 left by the rounding into 0.0
+    points = (np.round(points, 2) + 0.0).reshape((-1, 2, 2)).tolist()
+    return [(tuple(start_point), tuple(end_point)) for start_point, end_point in points]
+
+
+def auto_hatch_lines(
+    img,
+    line_spacing=1,
+    hatch_engine="scanline",
+    origin=(0, 0),
+    candidate_angles=hatch_candidate_angles,
+    criterion="strokes",
+    hatch_options=None,
+):
+    """
+    Fills the shapes of a grayscale mask at the candidate angle that is cheapest to plot.
+
+    A thin diagonal shape hatched horizontally gives many short lines, each with its own pen
+    lift; hatched along its length it gives a few long ones.
+
+    Parameters:
+    - img: The grayscale mask, shapes are pixels above 127.
+    - line_spacing: The spacing between lines used to fill the shapes.
+    - hatch_engine: The hatch fill engine, see hatch_lines.
+    - origin: The (x, y) position of img inside the full image.
+    - candidate_angles: The angles in degrees to compare. On a tie the first one wins.
+    - criterion: "strokes" picks the fewest lines, "plot_time" the lowest estimate_plot_time.
+    - hatch_options: Extra arguments of the hatch fill engine, see hatch_lines. The "bands"
+      engine hatches all the candidate angles with the same worker processes.
+
+    Returns:
+    - A tuple (hatch_angle, lines) with the chosen angle and its lines in full image coordinates.
+    """
+    if criterion not in ("strokes", "plot_time"):
+        raise ValueError(f"Unknown criterion '{criterion}'.")
+    hatch_options = hatch_options or {}
+    if (
+        hatch_engine == "bands"
+        and hatch_options.get("executor") is None
+        and hatch_options.get("max_workers") != 1
+    ):
+        with ProcessPoolExecutor(
+            max_workers=hatch_options.get("max_workers")
+        ) as executor:
+            return auto_hatch_lines(
+                img,
+                line_spacing,
+                hatch_engine,
+                origin,
+                candidate_angles,
+                criterion,
+                {**hatch_options, "executor": executor},
+            )
+
+    best_angle, best_lines, best_cost = None, None, None
+    for hatch_angle in candidate_angles:
+        lines = rotated_hatch_lines(
+            img, hatch_angle, line_spacing, hatch_engine, origin, hatch_options
+        )
+        cost = len(lines) if criterion == "strokes" else estimate_plot_time(lines)
+        if best_cost is None or cost < best_cost:
+            best_angle, best_lines, best_cost = hatch_angle, lines, cost
+    return best_angle, best_lines
+
+
+def angled_hatch_lines(
+    img,
+    line_spacing=1,
+    hatch_engine="scanline",
+    hatch_angle=0,
+    origin=(0, 0),
+    hatch_options=None,
+):
+    """
+    Fills the shapes of a grayscale mask with lines at a fixed or automatically chosen angle.
+
+    Parameters:
+    - img: The grayscale mask, shapes are pixels above 127.
+    - line_spacing: The spacing between lines used to fill the shapes.
+    - hatch_engine: The hatch fill engine, see hatch_lines.
+    - hatch_angle: The angle of the lines in degrees, "auto" to pick the one with the
+      fewest strokes (see auto_hatch_lines) or "auto_time" for the shortest estimated plot time.
+    - origin: The (x, y) position of img inside the full image.
+    - hatch_options: Extra arguments of the hatch fill engine, see hatch_lines.
+
+    Returns:
+    - A tuple (hatch_angle, lines) with the angle used and the lines in full image coordinates.
+    """
+    if hatch_angle == "auto":
+        return auto_hatch_lines(
+            img, line_spacing, hatch_engine, origin, hatch_options=hatch_options
+        )
+    if hatch_angle == "auto_time":
+        return auto_hatch_lines(
+            img,
+            line_spacing,
+            hatch_engine,
+            origin,
+            criterion="plot_time",
+            hatch_options=hatch_options,
+        )
+    return hatch_angle, rotated_hatch_lines(
+        img, hatch_angle, line_spacing, hatch_engine, origin, hatch_options
+    )
 
-        dwg.save()
 
+def outline_strokes(img, outline_tolerance=1.0, origin=(0, 0)):
+    """
+    Traces the outlines of the shapes of a grayscale mask as closed polylines.
+
+    Every outer boundary and every hole boundary is simplified with cv2.approxPolyDP and
+    becomes one continuous stroke, instead of one hatch line per row.
+
+    Parameters:
+    - img: The grayscale mask, shapes are pixels above 127.
+    - outline_tolerance: The maximum distance in pixels between a simplified polyline and
+      the traced boundary.
+    - origin: The (x, y) position of img inside the full image.
+
+    Returns:
+    - A list of strokes in full image coordinates. Each stroke is a list of (x, y) points
+      that ends where it starts; a single-pixel shape gives a two-point stroke on that pixel.
+    """
+    _, thresh = cv2.threshold(img, 127, 255, cv2.THRESH_BINARY)
+    contours, _ = cv2.findContours(thresh, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_NONE)
+    strokes = []
+    for contour in contours:
+        polygon = cv2.approxPolyDP(contour, outline_tolerance, True).reshape((-1, 2))
+        points = [(int(x) + origin[0], int(y) + origin[1]) for x, y in polygon]
+        strokes.append(points + [points[0]])
+    return strokes
+
+
+def offset_fill_strokes(img, line_spacing=1, outline_tolerance=1.0, origin=(0, 0)):
+    """
+    Fills the shapes of a grayscale mask with concentric rings.
+
+    The outlines of the shapes are traced, then the mask is eroded by line_spacing pixels and
+    the new outlines are traced, until nothing is left. Every ring is one continuous stroke,
+    so a large solid region takes a few long strokes instead of one stroke per row.
+
+    Parameters:
+    - img: The grayscale mask, shapes are pixels above 127.
+    - line_spacing: The distance between rings, the width of the pen in pixels.
+    - outline_tolerance: The polyline simplification tolerance of each ring.
+    - origin: The (x, y) position of img inside the full image.
+
+    Returns:
+    - A list of closed strokes in full image coordinates, outermost rings first.
+    """
+    _, mask = cv2.threshold(img, 127, 255, cv2.THRESH_BINARY)
+    kernel = cv2.getStructuringElement(
+        cv2.MORPH_ELLIPSE, (2 * line_spacing + 1, 2 * line_spacing + 1)
+    )
+    strokes = []
+    while mask.any():
+        strokes += outline_strokes(mask, outline_tolerance, origin)
+        mask = cv2.erode(mask, kernel, borderType=cv2.BORDER_CONSTANT, borderValue=0)
+    return strokes
+
+
+# Ways of drawing a layer, see vectorize_mask
+vectorization_mode_names = ("hatch", "outline", "offset", "centerline")
+
+
+def layer_vectorization_mode(vectorization_mode, layer_name):
+    """
+    Picks the vectorization mode of one layer.
+
+    Parameters:
+    - vectorization_mode: A mode name for every layer, or a dictionary mapping layer names to
+      mode names, where layers left out are hatched.
+    - layer_name: The name of the layer, such as "Black".
+
+    Returns:
+    - The mode name.
+    """
+    if isinstance(vectorization_mode, dict):
+        return vectorization_mode.get(layer_name, "hatch")
+    return vectorization_mode
+
+
+def vectorize_mask(
+    img,
+    vectorization_mode="hatch",
+    line_spacing=1,
+    hatch_engine="scanline",
+    hatch_angle=0,
+    outline_tolerance=1.0,
+    thin_width=3,
+    origin=(0, 0),
+    hatch_options=None,
+):
+    """
+    Turns the shapes of a grayscale mask into pen strokes.
+
+    Parameters:
+    - img: The grayscale mask, shapes are pixels above 127.
+    - vectorization_mode: "hatch" fills the shapes with parallel lines (see angled_hatch_lines),
+      "outline" only traces their boundaries (see outline_strokes), "offset" fills them with
+      concentric rings (see offset_fill_strokes), "centerline" draws the thin shapes as single
+      polylines along their centerline and hatches the others (see centerline_tracing).
+    - line_spacing: The spacing between lines used to fill the shapes.
+    - hatch_engine: The hatch fill engine, see hatch_lines.
+    - hatch_angle: The angle of the hatch lines in degrees or "auto", see angled_hatch_lines.
+    - outline_tolerance: The polyline simplification tolerance of the outline, offset and
+      centerline modes.
+    - thin_width: The widest line, in pixels, drawn along its centerline in the centerline mode.
+    - origin: The (x, y) position of img inside the full image.
+    - hatch_options: Extra arguments of the hatch fill engine, see hatch_lines.
+
+    Returns:
+    - A tuple (strokes, description) with the strokes in full image coordinates, each a
+      sequence of points, and a short description of how they were made.
+    """
+    if vectorization_mode == "hatch":
+        used_angle, lines = angled_hatch_lines(
+            img, line_spacing, hatch_engine, hatch_angle, origin, hatch_options
+        )
+        return lines, f"hatch angle {used_angle}"
+    if vectorization_mode == "outline":
+        strokes = outline_strokes(img, outline_tolerance, origin)
+        return strokes, f"outline, {len(strokes)} polylines"
+    if vectorization_mode == "offset":
+        strokes = offset_fill_strokes(img, line_spacing, outline_tolerance, origin)
+        return strokes, f"offset fill, {len(strokes)} rings"
+    if vectorization_mode == "centerline":
+        thin_mask, wide_mask = split_thin_components(img, thin_width)
+        strokes = centerline_strokes(thin_mask, outline_tolerance, origin)
+        used_angle, lines = angled_hatch_lines(
+            wide_mask, line_spacing, hatch_engine, hatch_angle, origin, hatch_options
+        )
+        return (
+            strokes + lines,
+            f"centerline, {len(strokes)} thin polylines, hatch angle {used_angle}",
+        )
+    raise ValueError(
+        f"Unknown vectorization mode '{vectorization_mode}'. "
+        f"Available: {', '.join(vectorization_mode_names)}."
+    )
+
+
+def vectorize_layer(cropped_mask, bbox, vectorization_mode="hatch", **options):
+    """
+    Vectorizes a layer mask cropped to its bounding box, in full image coordinates.
+
+    The crop is padded by one pixel so shapes touching the crop edge are traced the same way
+    as in the full-size mask.
+
+    Parameters:
+    - cropped_mask: The layer mask cropped to bbox, as returned by color_segmentation.segment_layers.
+    - bbox: The (x, y, width, height) of the crop inside the full image.
+    - vectorization_mode: The vectorization mode, see vectorize_mask.
+    - options: Extra arguments passed to vectorize_mask.
+
+    Returns:
+    - A tuple (strokes, description), see vectorize_mask.
+    """
+    padded = cv2.copyMakeBorder(cropped_mask, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+    return vectorize_mask(
+        padded, vectorization_mode, origin=(bbox[0] - 1, bbox[1] - 1), **options
+    )
+
+
+def vectorize_packed_mask(packed_mask, vectorization_mode="hatch", **options):
+    """
+    Vectorizes a bit-packed layer mask, see vectorize_layer.
+
+    Parameters:
+    - packed_mask: A PackedMask, unpacked to its bounding box.
+    - vectorization_mode: The vectorization mode, see vectorize_mask.
+    - options: Extra arguments passed to vectorize_mask.
+
+    Returns:
+    - A tuple (strokes, description), see vectorize_mask.
+    """
+    return vectorize_layer(
+        packed_mask.rows(), packed_mask.bbox, vectorization_mode, **options
+    )
+
+
+def vectorize_layers(
+    packed_masks, vectorization_mode="hatch", max_workers=1, **options
+):
+    """
+    Vectorizes several bit-packed layer masks, optionally in parallel worker processes.
+
+    Each mask is only unpacked, to its bounding box, while it is vectorized. With more than
+    one worker the packed masks are what is sent to the workers, about 1/8 of the bytes of the
+    masks, and the layers are submitted largest first, so the biggest layer starts right away
+    and the small ones fill the other workers around it. The total time then comes close to
+    the time of the largest layer alone.
+
+    Parameters:
+    - packed_masks: A dictionary mapping layer names to PackedMask objects, as returned by
+      packed_masks.pack_layers or load_packed_masks.
+    - vectorization_mode: A mode name, or a dictionary mapping layer names to mode names,
+      see layer_vectorization_mode.
+    - max_workers: The number of worker processes, 1 to vectorize in this process and None
+      for one per CPU. The "bands" hatch engine then falls back to "scanline", which gives
+      the same lines, so the workers do not start worker processes of their own.
+    - options: Extra arguments passed to vectorize_mask.
+
+    Returns:
+    - A dictionary mapping each layer name, in the order of packed_masks, to its
+      (strokes, description) tuple, see vectorize_mask.
+    """
+    if max_workers == 1:
+        return {
+            name: vectorize_packed_mask(
+                packed_mask,
+                layer_vectorization_mode(vectorization_mode, name),
+                **options,
+            )
+            for name, packed_mask in packed_masks.items()
+        }
+
+    if options.get("hatch_engine") == "bands":
+        options = {**options, "hatch_engine": "scanline", "hatch_options": None}
+    largest_first = sorted(
+        packed_masks, key=lambda name: packed_masks[name].area, reverse=True
+    )
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            name: executor.submit(
+                vectorize_packed_mask,
+                packed_masks[name],
+                layer_vectorization_mode(vectorization_mode, name),
+                **options,
+            )
+            for name in largest_first
+        }
+        return {name: futures[name].result() for name in packed_masks}
+
+
+def write_lines_svg(
+    svg_path, lines, width, height, line_thickness=1, svg_format="lines"
+):
+    """
+    Saves pen strokes as an SVG drawing on a black background.
+
+    The elements are streamed to the file as they are formatted (see svg_writer), which
+    gives the same file as an svgwrite drawing without building its document tree.
+
+    Parameters:
+    - svg_path: Path where the SVG file will be saved.
+    - lines: A list of strokes. Two-point strokes are saved as <line> elements and longer
+      ones as <polyline> elements.
+    - width: The width of the drawing.
+    - height: The height of the drawing.
+    - line_thickness: The thickness of the lines.
+    - svg_format: "lines", or "path" to save all the strokes as a single compact <path>
+      element (see svg_writer.StreamingSVGWriter).
+    """
+    write_svg_stream(svg_path, lines, width, height, line_thickness, svg_format)
+
+
+def process_mask(
+    img,
+    svg_path,
+    line_spacing=1,
+    line_thickness=1,
+    hatch_engine="scanline",
+    hatch_angle=0,
+    vectorization_mode="hatch",
+    outline_tolerance=1.0,
+    svg_format="lines",
+    hatch_options=None,
+):
+    """
+    Converts one grayscale mask into an SVG file of pen strokes.
+
+    Parameters:
+    - img: The grayscale mask, shapes are pixels above 127.
+    - svg_path: Path where the SVG file will be saved.
+    - line_spacing: The spacing between lines used to fill the shapes.
+    - line_thickness: The thickness of the lines used to fill the shapes.
+    - hatch_engine: The hatch fill engine, see hatch_lines.
+    - hatch_angle: The angle of the lines in degrees or "auto", see angled_hatch_lines.
+    - vectorization_mode: The vectorization mode, see vectorize_mask.
+    - outline_tolerance: The polyline simplification tolerance of the outline mode.
+    - svg_format: "lines" or "path", see write_lines_svg.
+    - hatch_options: Extra arguments of the hatch fill engine, see hatch_lines.
+
+    Returns:
+    - A short description of how the strokes were made, see vectorize_mask.
+    """
+    height, width = img.shape[:2]
+    strokes, description = vectorize_mask(
+        img,
+        vectorization_mode,
+        line_spacing,
+        hatch_engine,
+        hatch_angle,
+        outline_tolerance,
+        hatch_options=hatch_options,
+    )
+    write_lines_svg(svg_path, strokes, width, height, line_thickness, svg_format)
+    return description
+
+
+def process_image(image_path, svg_path, *args, **options):
+    """
+    Converts one segmented image into an SVG file of pen strokes.
+
+    Parameters:
+    - image_path: Path to the grayscale mask image.
+    - svg_path: Path where the SVG file will be saved.
+    - args, options: The remaining arguments of process_mask.
+
+    Returns:
+    - A short description of how the strokes were made, see vectorize_mask.
+    """
+    return process_mask(
+        cv2.imread(image_path, cv2.IMREAD_GRAYSCALE), svg_path, *args, **options
+    )
+
+
+def process_packed_mask(packed_mask, svg_path, *args, **options):
+    """
+    Converts one bit-packed layer mask into an SVG file of pen strokes, at full image size.
+
+    Parameters:
+    - packed_mask: A PackedMask, see packed_masks.
+    - svg_path: Path where the SVG file will be saved.
+    - args, options: The remaining arguments of process_mask.
+
+    Returns:
+    - A short description of how the strokes were made, see vectorize_mask.
+    """
+    return process_mask(packed_mask.to_array(), svg_path, *args, **options)
+
+
+def vectorization(
+    input_folder,
+    output_folder,
+    line_spacing=1,
+    line_thickness=1,
+    hatch_engine="scanline",
+    hatch_angle=0,
+    vectorization_mode="hatch",
+    outline_tolerance=1.0,
+    max_workers=1,
+    svg_format="lines",
+    hatch_options=None,
+):
+    """
+    Process all images in the specified input folder, converting them to SVG format with dense lines
+    within shape fills using contour detection, and save the results in the output folder.
+
+    Parameters:
+    - input_folder: Path to the folder containing the input images, or to a .npz file of
+      bit-packed masks saved by color_segmentation (packed_output_path), which are then sent
+      to the workers packed.
+    - output_folder: Path to the folder where the SVG files will be saved.
+    - line_spacing: The spacing between lines used to fill the shapes.
+    - line_thickness: The thickness of the lines used to fill the shapes.
+    - hatch_engine: The hatch fill engine, see hatch_lines.
+    - hatch_angle: The angle of the lines in degrees, or "auto" to pick it for each image.
+    - vectorization_mode: A mode name, or a dictionary mapping image names (without extension)
+      to mode names, see layer_vectorization_mode.
+    - outline_tolerance: The polyline simplification tolerance of the outline mode.
+    - max_workers: The number of worker processes, 1 to process the images one after the other
+      in this process and None for one per CPU. The images are submitted largest file (or
+      packed mask) first. The "bands" hatch engine then falls back to "scanline", see
+      vectorize_layers.
+    - svg_format: "lines" or "path", see write_lines_svg.
+    - hatch_options: Extra arguments of the hatch fill engine, see hatch_lines.
+    """
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    for filename in os.listdir(input_folder):
-        if filename.lower().endswith((".png", ".jpg", ".jpeg")):
-            image_path = os.path.join(input_folder, filename)
-            svg_filename = os.path.splitext(filename)[0] + ".svg"
-            svg_path = os.path.join(output_folder, svg_filename)
-            process_image(image_path, svg_path)
-            print(f"Processed {filename} into {svg_filename}")
+    # Every job is a mask source, either an image path or a PackedMask, followed by the
+    # remaining arguments of process_mask
+    if input_folder.lower().endswith(".npz"):
+        process = process_packed_mask
+        sources = load_packed_masks(input_folder)
+        source_sizes = {
+            name: packed_mask.nbytes for name, packed_mask in sources.items()
+        }
+    else:
+        process = process_image
+        sources = {
+            filename: os.path.join(input_folder, filename)
+            for filename in os.listdir(input_folder)
+            if filename.lower().endswith((".png", ".jpg", ".jpeg"))
+        }
+        # The compressed size of a mask grows with the number of shape edges, which is what
+        # the vectorization time depends on
+        source_sizes = {
+            filename: os.path.getsize(image_path)
+            for filename, image_path in sources.items()
+        }
+
+    if max_workers != 1 and hatch_engine == "bands":
+        hatch_engine, hatch_options = "scanline", None
+    jobs = {}
+    for filename, source in sources.items():
+        layer_name = os.path.splitext(filename)[0]
+        svg_filename = layer_name + ".svg"
+        svg_path = os.path.join(output_folder, svg_filename)
+        jobs[filename] = (
+            source,
+            svg_path,
+            line_spacing,
+            line_thickness,
+            hatch_engine,
+            hatch_angle,
+            layer_vectorization_mode(vectorization_mode, layer_name),
+            outline_tolerance,
+            svg_format,
+            hatch_options,
+        )
+
+    if max_workers == 1:
+        for filename, job in jobs.items():
+            description = process(*job)
+            print(
+                f"Processed {filename} into {os.path.basename(job[1])} ({description})"
+            )
+        return
+
+    largest_first = sorted(jobs, key=source_sizes.get, reverse=True)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        future_to_file = {
+            executor.submit(process, *jobs[filename]): filename
+            for filename in largest_first
+        }
+        for future in as_completed(future_to_file):
+            filename = future_to_file[future]
+            svg_filename = os.path.basename(jobs[filename][1])
+            print(f"Processed {filename} into {svg_filename} ({future.result()})")
+
+
+def fill_mode_report(input_folder, modes=("hatch", "offset"), line_spacing=1):
+    """
+    Prints the stroke count and travel of several vectorization modes for every segmented image.
+
+    Parameters:
+    - input_folder: Folder containing the segmented grayscale masks.
+    - modes: The vectorization modes to compare, see vectorize_mask.
+    - line_spacing: The spacing between lines used to fill the shapes.
+
+    Returns:
+    - A dictionary mapping each image name (without extension) to a dictionary of
+      toolpath_stats by mode.
+    """
+    print(
+        f"{'layer':<12} {'mode':<8} {'strokes':>8} {'drawing':>10} {'travel':>10} {'time (s)':>9}"
+    )
+    report = {}
+    for filename in sorted(os.listdir(input_folder)):
+        if not filename.lower().endswith((".png", ".jpg", ".jpeg")):
+            continue
+        layer_name = os.path.splitext(filename)[0]
+        img = cv2.imread(os.path.join(input_folder, filename), cv2.IMREAD_GRAYSCALE)
+        report[layer_name] = {}
+        for mode in modes:
+            strokes, _ = vectorize_mask(img, mode, line_spacing)
+            stats = report[layer_name][mode] = toolpath_stats(strokes)
+            print(
+                f"{layer_name:<12} {mode:<8} {stats['strokes']:>8} "
+                f"{stats['drawing']:>10.0f} {stats['travel']:>10.0f} "
+                f"{stats['plot_time']:>9.0f}"
+            )
+    return report
 
 
 # # Example usage
 # input_folder = "MAIN BRAINTER/GCodeGenerator/Assets/Segmented Images"
 # output_folder = "MAIN BRAINTER/GCodeGenerator/Assets/Vectorized Images"
 # vectorization(input_folder, output_folder)
+# fill_mode_report(input_folder)